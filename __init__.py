@@ -22,22 +22,31 @@ bl_info = {
     "category" : "Render"
 }
 
-import bpy
-C = bpy.context
-D = bpy.data
+try:
+    import bpy
+except ImportError: # the numpy tools (image, layout, ...) used outside blender
+    bpy = None
 
-from . import render
-from . import param
-from . import util
-from . import view
-from . import scene
-
-import importlib
-importlib.reload(render)
-importlib.reload(param)
-importlib.reload(util)
-importlib.reload(view)
-importlib.reload(scene)
+if bpy is not None:
+    if "render" in locals(): # reload scripts (F8) while developing
+        import importlib
+        import sys
+        # util.lazy() would hand out the stale modules, import them anew
+        for name in [n for n in sys.modules if n.startswith(__name__ + '.')]:
+            if name[len(__name__)+1:] not in (
+                    'util', 'render', 'param', 'view', 'scene'):
+                del sys.modules[name]
+        importlib.reload(util)
+        importlib.reload(render)
+        importlib.reload(param)
+        importlib.reload(view)
+        importlib.reload(scene)
+    else:
+        from . import util
+        from . import render
+        from . import param
+        from . import view
+        from . import scene
 
 def register():
     param.register()
@@ -0,0 +1,204 @@
+"""Render a queue of light field jobs in one headless blender.
+
+    blender -b --python batch.py -- --job job.json [--report report.json]
+    blender -b --python batch.py -- --job job.json --estimate --deadline 8
+
+job.json is a list of jobs (or {"jobs": [...]}), each of them a dict
+
+    {"blend": "scene.blend",     # opened first, the current file if missing
+     "scene": "Scene",           # the active scene if missing
+     "camera": "Camera",         # every lightfield-enabled camera if missing
+     "grid": [rows, cols],
+     "base": [base_x, base_y],
+     "passes": ["depth", "normal", "flow"],
+     "output": "/tmp/lf/",       # one sub directory per camera of a job
+     "options": {"persistent": true}}   # arguments of render.lightfield
+
+Every camera is rendered with the blocking operator, so no window, modal
+handler or timer is involved. Every job starts from the file as saved, the
+settings an earlier job changed are not carried over. Jobs that fail are reported and skipped, the
+exit code is 1 if any did. With --estimate the cameras are not rendered, a
+few sample views are rendered at reduced scale instead and the projected
+cost is written to estimate.json in the output of each camera.
+"""
+import argparse
+import json
+import os.path as path
+import sys
+import time
+import traceback
+from importlib import import_module
+
+import addon_utils
+import bpy
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+PACKAGE = path.basename(path.dirname(path.abspath(__file__)))
+PASSES = ['depth', 'normal', 'flow']
+ESTIMATED = ['geometry', 'sparse_step', 'adaptive', 'sample_fraction',
+             'progressive', 'preview_scale']
+
+
+def addon(module=''):
+    # opening a file or factory settings may leave the addon unregistered
+    if not hasattr(bpy.types.Object, 'lightfield'):
+        if ROOT not in sys.path:
+            sys.path.insert(0, ROOT)
+        addon_utils.enable(PACKAGE, default_set=False)
+    return import_module(f'{PACKAGE}.{module}' if module else PACKAGE)
+
+
+def load_jobs(filepath):
+    with open(filepath) as f:
+        jobs = json.load(f)
+    if isinstance(jobs, dict):
+        jobs = jobs['jobs']
+    base = path.dirname(path.abspath(filepath))
+    for job in jobs:
+        # paths in the job file are relative to it
+        for key in ['blend', 'output']:
+            if job.get(key):
+                job[key] = path.join(base, job[key])
+    return jobs
+
+
+def open_blend(job):
+    # setup() of an earlier job changed the grid, passes and camera in place,
+    # so a touched file is opened again and every job starts from the disk
+    blend = job.get('blend') or bpy.data.filepath
+    if blend and (bpy.data.is_dirty or
+                  path.abspath(bpy.data.filepath or '') != path.abspath(blend)):
+        if not path.exists(blend):
+            raise FileNotFoundError(blend)
+        bpy.ops.wm.open_mainfile(filepath=blend)
+    addon()
+    if job.get('scene'):
+        return bpy.data.scenes[job['scene']]
+    return bpy.context.scene
+
+
+def cameras(job, scene):
+    if job.get('camera'):
+        return [bpy.data.objects[job['camera']]]
+    return [obj for obj in scene.objects
+            if obj.type == 'CAMERA' and obj.lightfield.enabled]
+
+
+def setup(job, scene, cam, output):
+    bpy.context.view_layer.objects.active = cam
+    lf = cam.lightfield
+    if not lf.enabled: # creates the camera plane of the active object
+        lf.enabled = True
+    if job.get('grid'):
+        lf.num_rows, lf.num_cols = job['grid']
+    if job.get('base'):
+        lf.base_x, lf.base_y = job['base']
+    options = dict(job.get('options', {}))
+    if job.get('passes'):
+        for type in PASSES:
+            setattr(scene.geo, type, type in job['passes'])
+        options['geometry'] = True
+    scene.camera = cam
+    scene.render.filepath = path.join(output, '')
+    return options
+
+
+def render(scene, options, op=None):
+    # the operator reads context.scene, which may not be the window's scene
+    op = op or bpy.ops.render.lightfield
+    if hasattr(bpy.context, 'temp_override'):
+        with bpy.context.temp_override(scene=scene):
+            return op('EXEC_DEFAULT', **options)
+    return op({'scene': scene}, 'EXEC_DEFAULT', **options)
+
+
+def estimate(scene, options, output, deadline):
+    # the options that change the cost are estimated with the same setup
+    options = {key: value for key, value in options.items() if key in ESTIMATED}
+    render(scene, dict(options, deadline=deadline),
+           bpy.ops.render.lightfield_estimate)
+    with open(path.join(output, 'estimate.json')) as f:
+        result = json.load(f)
+    return {key: result[key] for key in [
+        'total_seconds', 'seconds_per_view', 'view_variation', 'total_bytes',
+        'peak_memory', 'shards']}
+
+
+def views(output):
+    manifest = addon('manifest')
+    return len(manifest.load(output))
+
+
+def run(index, job, dry_run=False, deadline=None):
+    """render every camera of one job, a result per camera"""
+    results = []
+    try:
+        scene = open_blend(job)
+        cams = cameras(job, scene)
+        if not cams:
+            raise ValueError('no lightfield-enabled camera')
+    except Exception as e:
+        return [{'job': index, 'blend': job.get('blend'), 'status': 'failed',
+                 'error': f'{type(e).__name__}: {e}', 'seconds': 0.0}]
+    output = job.get('output') or bpy.path.abspath(scene.render.filepath)
+    for cam in cams:
+        result = {'job': index, 'blend': job.get('blend'), 'camera': cam.name,
+                  'output': path.join(output, cam.name) if len(cams) > 1
+                            else output}
+        start = time.perf_counter()
+        try:
+            options = setup(job, scene, cam, result['output'])
+            if dry_run:
+                result['status'] = 'ready'
+                result['options'] = options
+            elif deadline is not None:
+                result['estimate'] = estimate(
+                    scene, options, result['output'], deadline)
+                result['status'] = 'estimated'
+            else:
+                status = render(scene, options)
+                result['status'] = 'done' if 'FINISHED' in status else 'cancelled'
+                result['views'] = views(result['output'])
+        except Exception as e:
+            result['status'] = 'failed'
+            result['error'] = f'{type(e).__name__}: {e}'
+            traceback.print_exc()
+        result['seconds'] = round(time.perf_counter() - start, 3)
+        print(f"job {index} {result['camera']}: {result['status']} in "
+              f"{result['seconds']:.1f}s" + (
+                  f" ({result['error']})" if 'error' in result else ''),
+              flush=True)
+        results.append(result)
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--job', required=True, help='json file of the jobs')
+    parser.add_argument('--report', default='',
+                        help='json file the status of every job is written to')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only open the files and set up the cameras')
+    parser.add_argument('--estimate', action='store_true',
+                        help='estimate the cost of every camera, do not render')
+    parser.add_argument('--deadline', type=float, default=0,
+                        help='hours a camera may take, for the suggested shards')
+    args = parser.parse_args(argv)
+    jobs = load_jobs(args.job)
+    start = time.perf_counter()
+    results = []
+    for index, job in enumerate(jobs):
+        results += run(index, job, args.dry_run,
+                       args.deadline if args.estimate else None)
+        if args.report: # written after every job, a crash keeps the rest
+            with open(args.report, 'w') as f:
+                json.dump(results, f, indent=2)
+    failed = [r for r in results if r['status'] in ('failed', 'cancelled')]
+    print(f'{len(results) - len(failed)}/{len(results)} cameras of '
+          f'{len(jobs)} jobs finished in {time.perf_counter() - start:.1f}s')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    argv = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else []
+    sys.exit(main(argv))
@@ -0,0 +1,540 @@
+"""Benchmarks of the light field pipeline, run headless inside blender:
+
+    blender -b --factory-startup --python bench.py -- persistent imread --output bench.json
+
+Every benchmark builds its own procedural scene, so no .blend file is needed,
+and renders on the CPU. With --baseline the results are compared against the
+json of an earlier run, a time that grew by more than --tolerance fails it.
+"""
+import argparse
+import json
+import os
+import os.path as path
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from importlib import import_module
+
+import addon_utils
+import bpy
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+PACKAGE = path.basename(path.dirname(path.abspath(__file__)))
+
+
+def addon(module=''):
+    # factory settings disable the addon again, so check its registration
+    if not hasattr(bpy.types.Object, 'lightfield'):
+        if ROOT not in sys.path:
+            sys.path.insert(0, ROOT)
+        addon_utils.enable(PACKAGE, default_set=False)
+    return import_module(f'{PACKAGE}.{module}' if module else PACKAGE)
+
+
+def test_scene(objects=20, subdivisions=2, grid=(3, 3), resolution=(320, 240),
+               engine='CYCLES', samples=16):
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    addon()
+    scene = bpy.context.scene
+    rng = random.Random(0)
+    for i in range(objects):
+        bpy.ops.mesh.primitive_ico_sphere_add(
+            subdivisions=subdivisions, radius=rng.uniform(0.2, 0.6),
+            location=(rng.uniform(-3, 3), rng.uniform(-3, 3), rng.uniform(-1, 1)))
+    light = bpy.data.objects.new('Light', bpy.data.lights.new('Light', 'SUN'))
+    scene.collection.objects.link(light)
+    cam = bpy.data.objects.new('Camera', bpy.data.cameras.new('Camera'))
+    scene.collection.objects.link(cam)
+    cam.location = (0, 0, 10)
+    scene.camera = cam
+
+    bpy.context.view_layer.objects.active = cam
+    lf = cam.lightfield
+    lf.enabled = True
+    lf.num_rows, lf.num_cols = grid
+    lf.base_x = lf.base_y = 0.1
+
+    render = scene.render
+    render.engine = engine
+    render.resolution_x, render.resolution_y = resolution
+    render.resolution_percentage = 100
+    if engine == 'CYCLES':
+        scene.cycles.device = 'CPU'
+        scene.cycles.samples = samples
+        scene.cycles.seed = 0
+    else:
+        scene.eevee.taa_render_samples = samples
+    render.image_settings.file_format = 'OPEN_EXR'
+    render.filepath = tempfile.mkdtemp() + '/'
+    return scene
+
+
+def view_times(dirpath):
+    manifest = addon('manifest')
+    return sorted(e['time'] for e in manifest.load(dirpath).values())
+
+
+def stats(times):
+    return {'views': len(times),
+            'mean': sum(times) / len(times),
+            'min': times[0],
+            'max': times[-1]}
+
+
+def bench_persistent(args):
+    """per-view time with and without persistent render data"""
+    util = addon('util')
+    manifest = addon('manifest')
+    scene = test_scene(objects=200, subdivisions=5)
+    results, outputs = {}, {}
+    for persistent in [False, True]:
+        scene.render.filepath = tempfile.mkdtemp() + '/'
+        outputs[persistent] = scene.render.filepath
+        bpy.ops.render.lightfield(persistent=persistent)
+        results['persistent' if persistent else 'normal'] = stats(
+            view_times(outputs[persistent]))
+
+    # the camera-only path has to produce the same pixels
+    diff = 0.0
+    for entry in manifest.load(outputs[False]).values():
+        a = util.imread(path.join(outputs[False], entry['file']))
+        b = util.imread(path.join(outputs[True], entry['file']))
+        diff = max(diff, float(abs(a - b).max()))
+    results['max_abs_diff'] = diff
+    results['identical'] = diff == 0.0
+    results['speedup'] = results['normal']['mean'] / results['persistent']['mean']
+    return results
+
+
+def timeit(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_imread(args):
+    """util.imread/imwrite against the python list based pixel access"""
+    util = addon('util')
+    import numpy as np
+    h, w = 2160, 3840
+    data = np.random.default_rng(0).random((h, w, 4), dtype=np.float32)
+    filepath = path.join(tempfile.mkdtemp(), 'bench.exr')
+    util.imwrite(filepath, data)
+    images = bpy.data.images
+
+    def read_list():
+        image = images.load(filepath, check_existing=False)
+        np.array(image.pixels[:]).reshape((h, w, 4))
+        images.remove(image)
+
+    def write_list():
+        image = images.new('bench', width=w, height=h, float_buffer=True)
+        image.pixels[:] = data.ravel()
+        images.remove(image)
+
+    def write_buffer():
+        image = images.new('bench', width=w, height=h, float_buffer=True)
+        image.pixels.foreach_set(data.reshape(-1))
+        images.remove(image)
+
+    out = np.empty((h, w, 4), dtype=np.float32)
+    results = {
+        'resolution': [w, h],
+        'read_list': timeit(read_list),
+        'read': timeit(lambda: util.imread(filepath)),
+        'read_into': timeit(lambda: util.imread(filepath, out=out)),
+        'read_channel': timeit(lambda: util.imread(filepath, channels=0)),
+        'write_list': timeit(write_list),
+        'write': timeit(write_buffer)}
+    results['read_speedup'] = results['read_list'] / results['read']
+    results['write_speedup'] = results['write_list'] / results['write']
+    return results
+
+
+class SyntheticViews(object):
+    """a light field of shifted copies of one noise image, generated on the
+    fly so even a 17x17 grid at 1080p never sits in memory"""
+    def __init__(self, rows, cols, height, width, disparity=2.0):
+        import numpy as np
+        layout = addon('layout')
+        self.grid = (rows, cols)
+        self.uv = layout.grid(rows, cols)
+        self.ratio = 1.0
+        self.disparity = disparity
+        rng = np.random.default_rng(0)
+        self.base = rng.random((height, width, 3), dtype=np.float32)
+
+    def __len__(self):
+        return self.grid[0] * self.grid[1]
+
+    def block(self, indices):
+        import numpy as np
+        return np.stack([
+            np.roll(self.base, (int(-v*self.disparity), int(u*self.disparity)),
+                    axis=(0, 1))
+            for u, v in self.uv[indices]])
+
+
+def bench_refocus(args):
+    """shift-and-add refocusing and focal stacks of 9x9 and 17x17 at 1080p"""
+    refocus = addon('refocus')
+    import tracemalloc
+    results = {}
+    for n in [9, 17]:
+        views = SyntheticViews(n, n, 1080, 1920)
+        tracemalloc.start()
+        start = time.perf_counter()
+        refocus.refocus(views, views.disparity)
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        refocus.focal_stack(views, [0, 1, 2, 3])
+        stack = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[f'{n}x{n}'] = {
+            'refocus': single,
+            'refocus_per_view': single / len(views),
+            'focal_stack_4': stack,
+            'peak_mb': peak / 2**20}
+    return results
+
+
+def bench_sparse(args):
+    """sparse 5x5 render with synthesized views against the dense render"""
+    util = addon('util')
+    manifest = addon('manifest')
+    synth = addon('synth')
+    scene = test_scene(objects=40, grid=(5, 5))
+    results, outputs = {}, {}
+    for step in [1, 2]:
+        scene.render.filepath = tempfile.mkdtemp() + '/'
+        outputs[step] = scene.render.filepath
+        start = time.perf_counter()
+        bpy.ops.render.lightfield(sparse_step=step, geometry=True)
+        results['dense' if step == 1 else 'sparse'] = time.perf_counter() - start
+
+    entries = manifest.load(outputs[2]).values()
+    scores = [
+        synth.psnr(util.imread(path.join(outputs[2], e['file']))[..., :3],
+                   util.imread(path.join(outputs[1], e['file']))[..., :3])
+        for e in entries if e.get('synthesized')]
+    results['synthesized'] = len(scores)
+    results['rendered'] = len(entries) - len(scores)
+    if scores:
+        results['psnr_mean'] = sum(scores) / len(scores)
+        results['psnr_min'] = min(scores)
+    results['speedup'] = results['dense'] / results['sparse']
+    return results
+
+
+def bench_adaptive(args):
+    """adaptive 5x5 render at a quarter of the samples, denoised across
+    views, against the full samples and a plain render at a quarter"""
+    util = addon('util')
+    manifest = addon('manifest')
+    synth = addon('synth')
+    scene = test_scene(objects=40, grid=(5, 5), samples=64)
+    results, outputs = {}, {}
+    for key, options in [('full', {}), ('adaptive', {'adaptive': True}),
+                         ('quarter', None)]:
+        scene.render.filepath = tempfile.mkdtemp() + '/'
+        outputs[key] = scene.render.filepath
+        if options is None:
+            scene.cycles.samples = 16
+        start = time.perf_counter()
+        bpy.ops.render.lightfield(**(options or {}))
+        results[key] = time.perf_counter() - start
+    scene.cycles.samples = 64
+
+    entries = manifest.load(outputs['adaptive']).values()
+    for key in ['adaptive', 'quarter']:
+        scores = [
+            synth.psnr(util.imread(path.join(outputs[key], e['file']))[..., :3],
+                       util.imread(path.join(outputs['full'], e['file']))[..., :3])
+            for e in entries]
+        results[f'psnr_{key}'] = sum(scores) / len(scores)
+    results['denoised'] = sum(1 for e in entries if e.get('denoised'))
+    results['rendered'] = len(entries) - results['denoised']
+    results['speedup'] = results['full'] / results['adaptive']
+    return results
+
+
+def bench_progressive(args):
+    """how evenly the first quarter of the views of each order covers a
+    9x9 plane, and the cost of a progressive 5x5 render"""
+    import numpy as np
+    layout = addon('layout')
+    metrics = addon('metrics')
+    results = {}
+    uv = layout.grid(9, 9)
+    for name, order in layout.ORDERS.items():
+        chosen = uv[order(9, 9, uv)[:len(uv) // 4]]
+        # the largest distance of a view to the nearest rendered one
+        distance = np.hypot(*(uv[:, None] - chosen[None]).transpose(2, 0, 1))
+        results[f'{name.lower()}_gap'] = float(distance.min(axis=1).max())
+    scene = test_scene(grid=(5, 5))
+    for key, options in [('plain', {}), ('progressive', {'progressive': True})]:
+        scene.render.filepath = tempfile.mkdtemp() + '/'
+        start = time.perf_counter()
+        bpy.ops.render.lightfield(view_order='HALTON', **options)
+        results[key] = time.perf_counter() - start
+    entries = metrics.load(path.join(scene.render.filepath, 'preview'))
+    results['preview'] = sum(sum(e.get(p, 0) for p in metrics.PHASES)
+                             for e in entries)
+    return results
+
+
+def bench_animation(args):
+    """frame-major against view-major order of an animated 3x3 light field"""
+    scene = test_scene(objects=100, subdivisions=4)
+    scene.frame_start, scene.frame_end = 1, 4
+    # every sphere and the camera move, so each frame changes the scene
+    for obj in scene.objects:
+        if obj.type in ('MESH', 'CAMERA'):
+            obj.keyframe_insert('location', frame=scene.frame_start)
+            obj.location.x += 0.5
+            obj.keyframe_insert('location', frame=scene.frame_end)
+    results = {}
+    for order in ['FRAME', 'VIEW']:
+        scene.render.filepath = tempfile.mkdtemp() + '/'
+        start = time.perf_counter()
+        bpy.ops.render.lightfield(animation=True, order=order)
+        total = time.perf_counter() - start
+        times = view_times(scene.render.filepath)
+        results[order.lower()] = dict(
+            stats(times), total=total, views_per_s=len(times) / total)
+    results['speedup'] = results['view']['total'] / results['frame']['total']
+    return results
+
+
+def bench_grid(args):
+    """light field render throughput for several grid sizes and resolutions"""
+    results = {}
+    for grid in [(3, 3), (5, 5)]:
+        for resolution in [(320, 240), (640, 480)]:
+            scene = test_scene(grid=grid, resolution=resolution, samples=8)
+            start = time.perf_counter()
+            bpy.ops.render.lightfield()
+            total = time.perf_counter() - start
+            times = view_times(scene.render.filepath)
+            key = '{}x{}@{}x{}'.format(*grid, *resolution)
+            results[key] = dict(
+                stats(times), total=total, views_per_s=len(times) / total)
+    return results
+
+
+def bench_poses(args):
+    """CamPoses of every layout for large grids"""
+    util = addon('util')
+    scene = test_scene()
+    lf = scene.camera.lightfield
+    results = {}
+    for n in [9, 17, 33]:
+        lf.num_rows = lf.num_cols = n
+        for kind in ['GRID', 'HEX', 'RING', 'SPIRAL']:
+            lf.layout = kind
+            results[f'{kind.lower()}_{n}x{n}'] = timeit(
+                lambda: util.CamPoses(scene.camera), repeat=20)
+    lf.layout = 'GRID'
+    return results
+
+
+def bench_disparity(args):
+    """RenderDisparity end to end, depth render and disparity of one view"""
+    scene = test_scene(objects=100, subdivisions=4, resolution=(640, 480))
+    return {'disparity': timeit(bpy.ops.render.disparity)}
+
+
+def bench_geometry(args):
+    """overhead of the geometry passes, alone and within a light field render"""
+    scene = test_scene(objects=100, subdivisions=4, resolution=(640, 480))
+    results = {'render': timeit(bpy.ops.render.render)}
+    scene.geo.enabled = True
+    scene.geo.base_path = tempfile.mkdtemp() + '/'
+    results['geometry'] = timeit(bpy.ops.render.geometry)
+    scene.geo.enabled = False
+    for geometry in [False, True]:
+        scene.render.filepath = tempfile.mkdtemp() + '/'
+        bpy.ops.render.lightfield(geometry=geometry)
+        results['lightfield_geometry' if geometry else 'lightfield'] = stats(
+            view_times(scene.render.filepath))
+    results['overhead_per_view'] = (results['lightfield_geometry']['mean']
+                                    - results['lightfield']['mean'])
+    return results
+
+
+def bench_off_axis(args):
+    """parallel views against off-axis views cropped to the shared pixels"""
+    scene = test_scene(objects=100, subdivisions=4, grid=(5, 5),
+                       resolution=(640, 480))
+    lf = scene.camera.lightfield
+    lf.base_x = lf.base_y = 0.5
+    lf.focus = 10
+    results = {}
+    for off_axis in [False, True]:
+        scene.render.filepath = tempfile.mkdtemp() + '/'
+        bpy.ops.render.lightfield(off_axis=off_axis, crop=off_axis)
+        results['off_axis' if off_axis else 'parallel'] = stats(
+            view_times(scene.render.filepath))
+        if off_axis:
+            with open(path.join(scene.render.filepath, 'calib.json')) as f:
+                results['resolution'] = json.load(f)['resolution']
+    results['speedup'] = results['parallel']['mean'] / results['off_axis']['mean']
+    return results
+
+
+def bench_incremental(args):
+    """incremental re-render of a 5x5 grid after moving one object"""
+    util = addon('util')
+    scene = test_scene(objects=100, subdivisions=4, grid=(5, 5))
+    output = scene.render.filepath
+    start = time.perf_counter()
+    bpy.ops.render.lightfield()
+    results = {'full': time.perf_counter() - start}
+    sphere = next(o for o in scene.objects if o.type == 'MESH')
+    sphere.location.x += 0.2
+    start = time.perf_counter()
+    bpy.ops.render.lightfield(incremental=True)
+    results['incremental'] = time.perf_counter() - start
+
+    # against a full render of the edited scene
+    scene.render.filepath = tempfile.mkdtemp() + '/'
+    bpy.ops.render.lightfield()
+    diff = 0.0
+    for file in sorted(os.listdir(output)):
+        if file.endswith('.exr') and '_' in file and file[:2].isdigit():
+            a = util.imread(path.join(output, file))
+            b = util.imread(path.join(scene.render.filepath, file))
+            diff = max(diff, float(abs(a - b).max()))
+    results['max_abs_diff'] = diff
+    results['speedup'] = results['full'] / results['incremental']
+    return results
+
+
+# util.lazy() puts a placeholder for numpy into sys.modules, only its
+# class tells whether numpy really ran
+STARTUP = """
+import importlib.util, json, sys, time, addon_utils
+sys.path.insert(0, {root!r})
+before = set(sys.modules)
+start = time.perf_counter()
+addon_utils.enable({package!r}, default_set=False)
+loaded = [n for n in set(sys.modules) - before
+          if not isinstance(sys.modules[n], importlib.util._LazyModule)]
+print('STARTUP', json.dumps({{
+    'enable': time.perf_counter() - start,
+    'modules': len(loaded),
+    'numpy': 'numpy' in loaded}}))
+"""
+
+
+def bench_startup(args, repeat=3):
+    """enabling the addon in a fresh headless blender, as every batch worker
+    does; the imported modules count grows when a heavy import leaks in"""
+    results = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = subprocess.run(
+            [bpy.app.binary_path, '-b', '--factory-startup', '--python-expr',
+             STARTUP.format(root=ROOT, package=PACKAGE)],
+            capture_output=True, text=True, check=True).stdout
+        line = next(l for l in out.splitlines() if l.startswith('STARTUP '))
+        results.append(dict(json.loads(line[len('STARTUP '):]),
+                            process=time.perf_counter() - start))
+    best = min(results, key=lambda r: r['enable'])
+    return dict(best, process=min(r['process'] for r in results))
+
+
+BENCHMARKS = {
+    'startup': bench_startup,
+    'grid': bench_grid,
+    'poses': bench_poses,
+    'disparity': bench_disparity,
+    'geometry': bench_geometry,
+    'refocus': bench_refocus,
+    'imread': bench_imread,
+    'persistent': bench_persistent,
+    'sparse': bench_sparse,
+    'adaptive': bench_adaptive,
+    'animation': bench_animation,
+    'progressive': bench_progressive,
+    'off_axis': bench_off_axis,
+    'incremental': bench_incremental,
+}
+
+
+# results that are better when they grow, every other number is a time
+HIGHER_IS_BETTER = ('speedup', 'psnr', 'per_s', 'identical', 'views',
+                    'synthesized', 'denoised', 'resolution')
+
+
+def leaves(results, prefix=''):
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            yield from leaves(value, name + '.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def compare(results, baseline, tolerance):
+    """relative change of every number against the baseline, returns the
+    names of the regressed times"""
+    old = dict(leaves(baseline))
+    regressed = []
+    for name, value in leaves(results):
+        if name not in old or not old[name]:
+            continue
+        change = value / old[name] - 1
+        worse = not any(k in name.split('.')[-1] for k in HIGHER_IS_BETTER) \
+            and change > tolerance
+        print(f'{name:50s} {old[name]:12.4f} {value:12.4f} {change:+8.1%}'
+              + ('  REGRESSION' if worse else ''))
+        if worse:
+            regressed.append(name)
+    return regressed
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('names', nargs='*', default=list(BENCHMARKS),
+                        help=f'benchmarks to run: {" ".join(BENCHMARKS)}')
+    parser.add_argument('--output', default='',
+                        help='json file the results are written to')
+    parser.add_argument('--baseline', default='',
+                        help='json file of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative slowdown that counts as a regression')
+    args = parser.parse_args(argv)
+    results = {'system': {
+        'blender': bpy.app.version_string,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()}}
+    for name in args.names:
+        print(f'benchmark {name}: {BENCHMARKS[name].__doc__}')
+        results[name] = BENCHMARKS[name](args)
+        print(json.dumps(results[name], indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressed = compare(
+            {k: v for k, v in results.items() if k != 'system'},
+            baseline, args.tolerance)
+        if regressed:
+            print(f'{len(regressed)} regressions against {args.baseline}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    argv = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else []
+    sys.exit(main(argv))
@@ -0,0 +1,69 @@
+"""Calibration of every view of a rendered light field.
+
+``calib.json`` holds the scalar metadata (camera, grid, baselines, disparity
+range, render settings) and ``calib.npz`` the per-view arrays:
+
+    uv          (N, 2)       plane coordinates of the layout
+    index       (N, 2)       (s, t) of the view in the {s:02}_{t:02} files
+    poses       ([F,] N, 4, 4) camera to world matrices
+    extrinsics  ([F,] N, 4, 4) world to camera matrices
+    intrinsics  (N, 3, 3)    pixel camera matrices
+
+Cameras use blender's axes, x right, y up and looking down -z, and image
+rows are bottom-up like every array of the addon. Animations have one
+matrix per rendered frame, in the order of ``frames`` in the json. The npz is
+stored uncompressed so load() can memory-map its arrays in place.
+"""
+import json
+import os.path as path
+import zipfile
+
+import numpy as np
+
+ARRAYS = 'calib.npz'
+HEADER = 'calib.json'
+
+
+def write(dirpath, arrays, meta):
+    np.savez(path.join(dirpath, ARRAYS), **arrays)
+    meta = dict(meta, arrays={
+        k: {'shape': list(np.shape(v)), 'dtype': np.asarray(v).dtype.name}
+        for k, v in arrays.items()})
+    with open(path.join(dirpath, HEADER), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def member(f, info):
+    # memory map of one stored .npy member, from its offset in the zip
+    f.seek(info.header_offset)
+    local = f.read(30)
+    name_len = int.from_bytes(local[26:28], 'little')
+    extra_len = int.from_bytes(local[28:30], 'little')
+    f.seek(info.header_offset + 30 + name_len + extra_len)
+    version = np.lib.format.read_magic(f)
+    read = {(1, 0): np.lib.format.read_array_header_1_0,
+            (2, 0): np.lib.format.read_array_header_2_0}[version]
+    shape, fortran, dtype = read(f)
+    return np.memmap(f.name, dtype=dtype, mode='r', offset=f.tell(),
+                     shape=shape, order='F' if fortran else 'C')
+
+
+def load(dirpath, mmap=True):
+    """metadata and a dict of arrays, memory-mapped unless mmap is False"""
+    with open(path.join(dirpath, HEADER)) as f:
+        meta = json.load(f)
+    filepath = path.join(dirpath, ARRAYS)
+    if not mmap:
+        with np.load(filepath) as data:
+            return meta, {k: data[k] for k in data.files}
+    arrays = {}
+    with zipfile.ZipFile(filepath) as archive, open(filepath, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f'{info.filename} is compressed')
+            arrays[info.filename[:-len('.npy')]] = member(f, info)
+    return meta, arrays
+
+
+def exists(dirpath):
+    return path.exists(path.join(dirpath, HEADER))
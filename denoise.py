@@ -0,0 +1,58 @@
+"""Angular denoising of light field views rendered with few samples.
+
+Neighbouring views see almost the same radiance, so the noise of a view is
+averaged down with the views around it, forward-warped onto it with their
+disparity like synth.py. A warped pixel only counts where its disparity
+agrees with the view's own, so edges and disocclusions stay sharp. The
+spread of the averaged samples tells where the estimate is still noisy and
+needs more samples.
+"""
+import numpy as np
+
+if __package__:
+    from . import synth
+else: # run as a script
+    import synth
+
+
+def denoise(color, disparity, neighbours, uv, ratio=1.0, tolerance=0.5,
+            floor=0.05):
+    """average a view with the (color, disparity, uv) of its neighbours,
+    returns the colour and the noise of every pixel: the standard error of
+    the mean relative to its brightness, infinite where no neighbour agrees"""
+    total = color.astype(np.float32)
+    square = total ** 2
+    count = np.ones(disparity.shape, dtype=np.float32)
+    for c, d, src in neighbours:
+        du, dv = uv[0] - src[0], uv[1] - src[1]
+        c, d, covered = synth.warp(c, d, du, dv, ratio)
+        keep = (covered & (np.abs(d - disparity) <= tolerance))[..., None]
+        total += c * keep
+        square += c ** 2 * keep
+        count += keep[..., 0]
+    mean = total / count[..., None]
+    rgb = slice(0, min(3, color.shape[-1]))
+    variance = np.maximum(square / count[..., None] - mean ** 2, 0)[..., rgb]
+    error = np.sqrt(variance.mean(-1) / count)
+    noise = error / np.maximum(np.abs(mean[..., rgb]).mean(-1), floor)
+    noise[count < 2] = np.inf
+    return mean, noise
+
+
+def region(noise, threshold, tile=64):
+    """tile aligned rectangle (x0, y0, x1, y1) around the tiles whose mean
+    noise is above threshold, None if there are none"""
+    H, W = noise.shape
+    noise = np.minimum(noise, 1e6) # a tile of unmatched pixels stays finite
+    rect = None
+    for y in range(0, H, tile):
+        for x in range(0, W, tile):
+            if noise[y:y+tile, x:x+tile].mean() <= threshold:
+                continue
+            x1, y1 = min(x + tile, W), min(y + tile, H)
+            if rect is None:
+                rect = (x, y, x1, y1)
+            else:
+                rect = (min(rect[0], x), min(rect[1], y),
+                        max(rect[2], x1), max(rect[3], y1))
+    return rect
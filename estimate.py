@@ -0,0 +1,89 @@
+"""Cost model of a light field render, fitted to a few sample renders.
+
+The render time of a view is modelled as ``a + b * pixels * samples``: a
+fixed cost for scene sync, compositing and writing, and a part that grows
+with the work of the renderer. Sample views are rendered at two reduced
+scales of resolution and samples, the model is fitted to them and projected
+to the full resolution, samples and number of views. The output size grows
+with the pixels, the peak memory is extrapolated linearly in the pixels from
+the largest resident memory seen while each sample view rendered.
+"""
+import math
+import os
+
+import numpy as np
+
+
+def fit(work, seconds):
+    """least squares a, b of seconds = a + b * work, neither negative"""
+    work = np.asarray(work, dtype=np.float64)
+    seconds = np.asarray(seconds, dtype=np.float64)
+    if len(np.unique(work)) < 2:
+        return 0.0, float(seconds.mean() / max(work.mean(), 1))
+    A = np.stack([np.ones_like(work), work], axis=-1)
+    a, b = np.linalg.lstsq(A, seconds, rcond=None)[0]
+    if b < 0: # noise dominated, all of it is fixed cost
+        return float(seconds.mean()), 0.0
+    if a < 0: # through the origin
+        return 0.0, float((work @ seconds) / (work @ work))
+    return float(a), float(b)
+
+
+def project(measurements, pixels, samples, views, written=None):
+    """projection of a render of views views at the given pixels and samples
+    from a list of dicts with view, pixels, samples, seconds, bytes and rss;
+    written views (all rendered ones by default) count towards the bytes"""
+    written = views if written is None else written
+    work = [m['pixels'] * m['samples'] for m in measurements]
+    seconds = [m['seconds'] for m in measurements]
+    a, b = fit(work, seconds)
+    per_view = a + b * pixels * samples
+    # how much slower or faster than the model every sampled view is
+    factors = {}
+    for m, w in zip(measurements, work):
+        factors.setdefault(m['view'], []).append(m['seconds'] / max(a + b*w, 1e-9))
+    factors = np.array([np.mean(f) for f in factors.values()])
+    largest = max(m['pixels'] for m in measurements)
+    at_largest = [m for m in measurements if m['pixels'] == largest]
+    bytes_per_pixel = np.mean([m['bytes'] / m['pixels'] for m in at_largest])
+    rss = {}
+    for m in measurements:
+        if m.get('rss'):
+            rss[m['pixels']] = max(rss.get(m['pixels'], 0), m['rss'])
+    memory = None
+    if rss:
+        low, high = min(rss), max(rss)
+        slope = (rss[high] - rss[low]) / (high - low) if high > low else 0
+        memory = max(rss.values()) + max(0, slope) * (pixels - high)
+    return {
+        'model': {'fixed_seconds': a, 'seconds_per_sample_pixel': b},
+        'views': views,
+        'pixels': pixels,
+        'samples': samples,
+        'seconds_per_view': per_view,
+        'seconds_per_view_min': per_view * float(factors.min()),
+        'seconds_per_view_max': per_view * float(factors.max()),
+        'view_variation': float(factors.std() / factors.mean()),
+        'total_seconds': per_view * views,
+        'bytes_per_view': float(bytes_per_pixel * pixels),
+        'total_bytes': float(bytes_per_pixel * pixels * written),
+        'peak_memory': memory}
+
+
+def shards(total_seconds, deadline=None, memory=None, available=None):
+    """number of shards, each on its own machine or gpu, that finishes by
+    the deadline in seconds, and how many fit into the available memory"""
+    result = {'for_deadline': None, 'fit_in_memory': None}
+    if deadline:
+        result['for_deadline'] = max(1, math.ceil(total_seconds / deadline))
+    if memory and available:
+        result['fit_in_memory'] = max(1, int(available // memory))
+    return result
+
+
+def available_memory():
+    """physical memory of the machine in bytes, None where unknown"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
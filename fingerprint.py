@@ -0,0 +1,214 @@
+"""Fingerprint of the scene a light field was rendered from.
+
+``fingerprint.json`` keeps a hash and the world bounding box of every
+rendered object, and one hash of what changes every pixel at once (world,
+lights, colour management and engine settings). Comparing it with the scene
+of the next render tells which objects changed; only the pixels of views
+that can see their old or new bounding box have to be rendered again.
+Shadows and reflections a change casts outside its bounding box are not
+detected, changed lights re-render everything.
+"""
+import hashlib
+import json
+import os
+import os.path as path
+
+import numpy as np
+
+from .manifest import rna_values
+
+FILENAME = 'fingerprint.json'
+GEOMETRY = {'MESH', 'CURVE', 'CURVES', 'SURFACE', 'META', 'FONT', 'VOLUME',
+            'POINTCLOUD', 'GPENCIL'}
+# property, values per element and buffer type of mesh attribute data
+ATTRIBUTES = {
+    'FLOAT': ('value', 1, np.float32),
+    'INT': ('value', 1, np.int32),
+    'INT8': ('value', 1, np.int32),
+    'BOOLEAN': ('value', 1, bool),
+    'FLOAT2': ('vector', 2, np.float32),
+    'FLOAT_VECTOR': ('vector', 3, np.float32),
+    'INT32_2D': ('value', 2, np.int32),
+    'QUATERNION': ('value', 4, np.float32),
+    'FLOAT_COLOR': ('color', 4, np.float32),
+    'BYTE_COLOR': ('color', 4, np.float32),
+}
+
+
+def digest(values):
+    return hashlib.sha1(repr(values).encode()).hexdigest()
+
+
+def tree_values(tree):
+    if tree is None:
+        return None
+    values = []
+    for node in tree.nodes:
+        image = getattr(node, 'image', None)
+        values.append((node.bl_idname, node.name, rna_values(node),
+                       image.filepath if image else None,
+                       [rna_values(input) for input in node.inputs]))
+    values.append(sorted(
+        (l.from_node.name, l.from_socket.identifier,
+         l.to_node.name, l.to_socket.identifier) for l in tree.links))
+    return values
+
+
+def material_hash(material):
+    if material is None:
+        return None
+    return digest((material.name, rna_values(material),
+                   tree_values(material.node_tree if material.use_nodes else None)))
+
+
+def array_hash(collection, prop, width=1, dtype=np.float32):
+    data = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(prop, data)
+    return hashlib.sha1(data.tobytes()).hexdigest()
+
+
+def mesh_values(mesh):
+    # positions, topology, shading, uvs, colours and every other attribute;
+    # attributes starting with a dot are selection and visibility
+    values = [array_hash(mesh.vertices, 'co', 3),
+              array_hash(mesh.loops, 'vertex_index', 1, np.int32),
+              array_hash(mesh.polygons, 'loop_total', 1, np.int32),
+              array_hash(mesh.polygons, 'use_smooth', 1, bool),
+              array_hash(mesh.polygons, 'material_index', 1, np.int32)]
+    for layer in mesh.uv_layers:
+        values.append((layer.name, array_hash(layer.data, 'uv', 2)))
+    for layer in getattr(mesh, 'vertex_colors', ()):
+        values.append((layer.name, array_hash(layer.data, 'color', 4)))
+    return values + attribute_values(mesh)
+
+
+def attribute_values(data):
+    # the geometry attributes of meshes, curves and point clouds
+    values = []
+    for attribute in getattr(data, 'attributes', ()):
+        if attribute.name.startswith('.') or \
+                attribute.data_type not in ATTRIBUTES:
+            continue
+        prop, width, dtype = ATTRIBUTES[attribute.data_type]
+        values.append((attribute.name, attribute.domain, array_hash(
+            attribute.data, prop, width, dtype)))
+    return values
+
+
+def object_hash(obj):
+    """hash of an evaluated object, its transform, geometry and materials"""
+    values = [obj.type, [round(x, 6) for row in obj.matrix_world for x in row],
+              [material_hash(slot.material) for slot in obj.material_slots]]
+    if obj.type == 'MESH':
+        values.append(mesh_values(obj.data))
+    elif obj.type in ('CURVE', 'SURFACE', 'FONT', 'META'):
+        # splines and metaball elements are collections rna_values skips,
+        # the mesh they evaluate to has every control point in it
+        mesh = obj.to_mesh()
+        try:
+            values.append(mesh_values(mesh) if mesh else None)
+        finally:
+            obj.to_mesh_clear()
+        values.append(rna_values(obj.data))
+    elif obj.type in ('CURVES', 'POINTCLOUD'):
+        values += [rna_values(obj.data), attribute_values(obj.data)]
+    elif obj.data is not None:
+        values.append(rna_values(obj.data))
+    return digest(values)
+
+
+def bbox(obj):
+    corners = np.array([tuple(c) for c in obj.bound_box] or [(0, 0, 0)] * 8)
+    matrix = np.array(obj.matrix_world)
+    return (corners @ matrix[:3, :3].T + matrix[:3, 3]).tolist()
+
+
+def scene_hash(scene):
+    values = [material_hash(scene.world) if scene.world else None,
+              rna_values(scene.view_settings), rna_values(scene.display_settings)]
+    for engine in ['cycles', 'eevee']:
+        if hasattr(scene, engine):
+            values.append(rna_values(getattr(scene, engine)))
+    return digest(values)
+
+
+def take(scene, depsgraph, exclude=()):
+    objects = {}
+    for obj in depsgraph.objects:
+        original = obj.original
+        if original.name in exclude or original.hide_render:
+            continue
+        if obj.type not in GEOMETRY and obj.type != 'LIGHT':
+            continue
+        objects[original.name] = {
+            'hash': object_hash(obj),
+            'light': obj.type == 'LIGHT',
+            'bbox': bbox(obj)}
+    return {'global': scene_hash(scene), 'objects': objects}
+
+
+def load(dirpath):
+    filepath = path.join(dirpath, FILENAME)
+    if not path.exists(filepath):
+        return None
+    with open(filepath) as f:
+        return json.load(f)
+
+
+def save(dirpath, fingerprint):
+    # several shards may finish at the same time
+    filepath = path.join(dirpath, FILENAME)
+    with open(filepath + f'.{os.getpid()}', 'w') as f:
+        json.dump(fingerprint, f)
+    os.replace(filepath + f'.{os.getpid()}', filepath)
+
+
+def discard(dirpath):
+    filepath = path.join(dirpath, FILENAME)
+    if path.exists(filepath):
+        os.remove(filepath)
+
+
+def changes(old, new):
+    """names of the changed objects and their old and new bounding boxes as
+    an (M, 8, 3) array, None when every view has changed"""
+    if old.get('global') != new['global']:
+        return None
+    names, boxes = [], []
+    for name in sorted(set(old['objects']) | set(new['objects'])):
+        a, b = old['objects'].get(name), new['objects'].get(name)
+        if a and b and a['hash'] == b['hash']:
+            continue
+        if (a or b)['light']:
+            return None
+        names.append(name)
+        boxes += [entry['bbox'] for entry in (a, b) if entry]
+    return names, np.array(boxes, dtype=np.float64).reshape(-1, 8, 3)
+
+
+def region(boxes, pose, K, size, near):
+    """pixel rectangle (x0, y0, x1, y1) of the boxes in the image of a camera
+    with the camera to world pose and pixel matrix K, rows bottom up; None
+    when no box is in view"""
+    W, H = size
+    world_to_cam = np.linalg.inv(pose)
+    rect = None
+    for box in boxes:
+        cam = box @ world_to_cam[:3, :3].T + world_to_cam[:3, 3]
+        depth = -cam[:, 2] # blender cameras look down -z
+        if (depth < near).all():
+            continue
+        if (depth < near).any(): # the box reaches behind the camera
+            return (0, 0, W, H)
+        x = K[0, 0] * cam[:, 0] / depth + K[0, 2]
+        y = K[1, 1] * cam[:, 1] / depth + K[1, 2]
+        x0, y0 = max(0, int(np.floor(x.min()))), max(0, int(np.floor(y.min())))
+        x1, y1 = min(W, int(np.ceil(x.max()))), min(H, int(np.ceil(y.max())))
+        if x1 <= x0 or y1 <= y0:
+            continue
+        if rect is None:
+            rect = (x0, y0, x1, y1)
+        else:
+            rect = (min(rect[0], x0), min(rect[1], y0),
+                    max(rect[2], x1), max(rect[3], y1))
+    return rect
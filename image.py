@@ -0,0 +1,88 @@
+"""Reading and writing images without blender's image api.
+
+The arrays are float32 with the rows in blender's order (bottom row first),
+so they match util.imread inside blender. EXR files are handled by the
+OpenEXR bindings, everything else by imageio; both are optional and only
+imported when a file of that kind is read or written.
+"""
+import numpy as np
+
+EXR_CHANNELS = ['R', 'G', 'B', 'A']
+
+
+def read_exr(path, channels=None, out=None):
+    import OpenEXR
+    import Imath
+    f = OpenEXR.InputFile(path)
+    try:
+        header = f.header()
+        window = header['dataWindow']
+        w = window.max.x - window.min.x + 1
+        h = window.max.y - window.min.y + 1
+        names = [c for c in EXR_CHANNELS if c in header['channels']]
+        names = names or sorted(header['channels'])
+        if channels is not None:
+            names = [names[i] for i in np.atleast_1d(channels)]
+        if out is None:
+            out = np.empty((h, w, len(names)), dtype=np.float32)
+        pixel = Imath.PixelType(Imath.PixelType.FLOAT)
+        # only the requested channels are decoded
+        for i, name in enumerate(names):
+            data = np.frombuffer(f.channel(name, pixel), dtype=np.float32)
+            out[..., i] = data.reshape(h, w)[::-1]
+    finally:
+        f.close()
+    if channels is not None and np.ndim(channels) == 0:
+        return out[..., 0]
+    return out
+
+
+def read(path, channels=None, out=None):
+    if path.lower().endswith('.exr'):
+        return read_exr(path, channels, out)
+    import imageio
+    data = np.asarray(imageio.imread(path))
+    if data.ndim == 2:
+        data = data[..., None]
+    if channels is not None:
+        data = data[..., channels]
+    scale = np.iinfo(data.dtype).max if data.dtype.kind in 'ui' else 1
+    if out is None:
+        out = np.empty(data.shape, dtype=np.float32)
+    np.divide(data[::-1], scale, out=out, dtype=np.float32, casting='unsafe')
+    return out
+
+
+def write_exr(path, data, half=True, codec='ZIP'):
+    import OpenEXR
+    import Imath
+    h, w, c = data.shape
+    names = EXR_CHANNELS[:c] if c > 1 else ['Y']
+    pixel = Imath.PixelType(
+        Imath.PixelType.HALF if half else Imath.PixelType.FLOAT)
+    header = OpenEXR.Header(w, h)
+    header['channels'] = {name: Imath.Channel(pixel) for name in names}
+    codec = 'NO' if codec == 'NONE' else codec
+    header['compression'] = Imath.Compression(
+        getattr(Imath.Compression, f'{codec}_COMPRESSION'))
+    dtype = np.float16 if half else np.float32
+    f = OpenEXR.OutputFile(path, header)
+    try:
+        f.writePixels({
+            name: np.ascontiguousarray(data[::-1, :, i], dtype).tobytes()
+            for i, name in enumerate(names)})
+    finally:
+        f.close()
+
+
+def write(path, data, depth=None, codec='ZIP'):
+    # depth is blender's color_depth: '16'/'32' for EXR, '8'/'16' otherwise
+    if data.ndim == 2:
+        data = data[..., None]
+    if path.lower().endswith('.exr'):
+        return write_exr(path, data, half=depth != '32', codec=codec)
+    import imageio
+    dtype = np.uint16 if depth == '16' else np.uint8
+    scale = np.iinfo(dtype).max
+    out = (np.clip(data[::-1], 0, 1) * scale + 0.5).astype(dtype)
+    imageio.imwrite(path, out[..., 0] if out.shape[-1] == 1 else out)
@@ -0,0 +1,141 @@
+"""Sampling patterns of the camera array.
+
+A layout maps the (rows, cols) of the light field camera to an (N, 2) array
+of plane coordinates (u, v), which CamPoses scales by its x and y baseline
+vectors. View i keeps the grid index (i // cols, i % cols), so every layout
+is written into the same {s:02}_{t:02} files.
+"""
+import numpy as np
+
+GOLDEN_ANGLE = np.pi * (3 - np.sqrt(5))
+
+
+def axis(n):
+    return np.linspace(-1, 1, n) if n > 1 else np.zeros(n)
+
+
+def grid(rows, cols):
+    v, u = np.meshgrid(axis(rows), axis(cols), indexing='ij')
+    return np.stack([u.ravel(), v.ravel()], axis=-1)
+
+
+def hexagonal(rows, cols):
+    # every odd row is shifted by half a column
+    uv = grid(rows, cols)
+    if cols > 1 and rows > 1:
+        half = 1 / (cols-1)
+        uv[:, 0] += half * (np.arange(rows*cols) // cols % 2) - half / 2
+    return uv
+
+
+def ring(rows, cols):
+    # rows concentric rings of cols cameras, neighbouring rings staggered
+    s, t = np.divmod(np.arange(rows*cols), cols)
+    radius = (s+1) / rows
+    angle = 2 * np.pi * (t + s/2) / cols
+    return np.stack([radius*np.cos(angle), radius*np.sin(angle)], axis=-1)
+
+
+def spiral(rows, cols):
+    # Vogel's sunflower spiral, evenly covering the unit disk
+    n = rows * cols
+    i = np.arange(n)
+    radius = np.sqrt((i+0.5) / n)
+    angle = i * GOLDEN_ANGLE
+    return np.stack([radius*np.cos(angle), radius*np.sin(angle)], axis=-1)
+
+
+def points(uv):
+    uv = np.asarray(uv, dtype=np.float64).reshape(-1, np.shape(uv)[-1])
+    return uv[:, :2].copy()
+
+
+LAYOUTS = {
+    'GRID': grid,
+    'HEX': hexagonal,
+    'RING': ring,
+    'SPIRAL': spiral,
+}
+
+
+def sparse(rows, cols, step):
+    """indices of every step-th row and column, always with the last row and
+    column so the corners are included"""
+    def keep(n):
+        return sorted(set(range(0, n, step)) | {n-1})
+    return [s*cols + t for s in keep(rows) for t in keep(cols)]
+
+
+def spread(uv, n):
+    """indices of n views spread over the camera plane, the most central one
+    first and then always the one farthest from all chosen so far"""
+    uv = np.asarray(uv, dtype=np.float64)
+    chosen = [int(np.argmin(np.hypot(*(uv - uv.mean(axis=0)).T)))]
+    distance = np.hypot(*(uv - uv[chosen[0]]).T)
+    while len(chosen) < min(n, len(uv)):
+        chosen.append(int(np.argmax(distance)))
+        distance = np.minimum(distance, np.hypot(*(uv - uv[chosen[-1]]).T))
+    return chosen
+
+
+def raster(rows, cols, uv):
+    return list(range(len(uv)))
+
+
+def center(rows, cols, uv):
+    # nearest to the centre of the plane first
+    uv = np.asarray(uv, dtype=np.float64)
+    return np.argsort(np.hypot(*(uv - uv.mean(axis=0)).T), kind='stable').tolist()
+
+
+def bisect(rows, cols, uv):
+    # the corners, then always the views halfway between the ones before,
+    # every prefix of a level is an ever denser sparse grid
+    step = 1
+    while step < max(rows, cols) - 1:
+        step *= 2
+    order, seen = [], set()
+    while True:
+        for i in sparse(rows, cols, step):
+            if i not in seen:
+                seen.add(i)
+                order.append(i)
+        if step == 1:
+            return order
+        step //= 2
+
+
+def radical_inverse(i, base):
+    result, f = 0.0, 1.0 / base
+    while i:
+        i, digit = divmod(i, base)
+        result += digit * f
+        f /= base
+    return result
+
+
+def halton(rows, cols, uv):
+    # the view nearest to each point of the (2, 3) halton sequence over the
+    # bounds of the plane, among the views not taken yet
+    uv = np.asarray(uv, dtype=np.float64)
+    lo, hi = uv.min(axis=0), uv.max(axis=0)
+    left = np.ones(len(uv), dtype=bool)
+    order = []
+    i = 0
+    while len(order) < len(uv):
+        i += 1
+        point = lo + (hi - lo) * (radical_inverse(i, 2), radical_inverse(i, 3))
+        distance = np.where(left, np.hypot(*(uv - point).T), np.inf)
+        order.append(int(np.argmin(distance)))
+        left[order[-1]] = False
+    return order
+
+
+# the order views are rendered in, so that a render cut short still leaves
+# views spread over the whole plane
+ORDERS = {
+    'RASTER': raster,
+    'CENTER': center,
+    'BISECT': bisect,
+    'HALTON': halton,
+}
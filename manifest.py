@@ -0,0 +1,107 @@
+"""Completion manifest of a light field render.
+
+Every finished view appends one json line to ``manifest.jsonl`` next to
+``param.txt``, so several processes can share the same manifest and a killed
+render leaves at most one incomplete line behind.
+"""
+import hashlib
+import json
+import os.path as path
+
+FILENAME = 'manifest.jsonl'
+# ui state that does not change pixels
+IGNORE = {'rna_type', 'select', 'location', 'width', 'height', 'dimensions',
+          'hide', 'show_options', 'show_preview', 'show_texture',
+          'show_expanded'}
+
+
+def settings_hash(scene, location, rotation, shift=None):
+    """hash of everything that changes the pixels of one view, shift
+    overrides the camera's shift_x/y"""
+    render = scene.render
+    image = render.image_settings
+    cam = scene.camera.data
+    settings = (
+        [round(x, 6) for x in location],
+        [round(x, 6) for row in rotation for x in row],
+        cam.type, cam.lens, cam.sensor_fit, cam.sensor_width,
+        cam.sensor_height,
+        *([round(x, 6) for x in shift] if shift else [cam.shift_x, cam.shift_y]),
+        cam.clip_start, cam.clip_end,
+        render.engine, render.resolution_x, render.resolution_y,
+        render.resolution_percentage,
+        render.pixel_aspect_x, render.pixel_aspect_y,
+        image.file_format, image.color_mode, image.color_depth,
+        render.film_transparent, scene.frame_current,
+        rna_values(scene.view_settings), rna_values(scene.display_settings),
+        *[rna_values(getattr(scene, engine)) for engine in ['cycles', 'eevee']
+          if hasattr(scene, engine)])
+    if render.use_border:
+        settings += (render.use_crop_to_border,
+                     render.border_min_x, render.border_min_y,
+                     render.border_max_x, render.border_max_y)
+    return hashlib.sha1(repr(settings).encode()).hexdigest()
+
+
+def rna_values(struct):
+    # every plain property of a blender struct, pointers and lists excluded
+    values = []
+    for prop in struct.bl_rna.properties:
+        if prop.type in ('POINTER', 'COLLECTION') or prop.identifier in IGNORE:
+            continue
+        value = getattr(struct, prop.identifier, None)
+        if isinstance(value, set): # enum flags, in a stable order
+            value = tuple(sorted(value))
+        elif not isinstance(value, str):
+            try:
+                value = tuple(value)
+            except TypeError:
+                pass
+        values.append((prop.identifier, value))
+    return values
+
+
+def load(dirpath):
+    entries = {}
+    filepath = path.join(dirpath, FILENAME)
+    if not path.exists(filepath):
+        return entries
+    with open(filepath) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError: # a line cut short by a crash
+                continue
+            entries[entry['view']] = entry
+    return entries
+
+
+def valid(entry, dirpath, hash, passes=()):
+    if entry is None or entry['hash'] != hash:
+        return False
+    files = dict(entry.get('passes', []))
+    files[entry['file']] = entry['size']
+    for file in passes:
+        if file not in files:
+            return False
+    for file, size in files.items():
+        filepath = path.join(dirpath, file)
+        if not path.exists(filepath) or path.getsize(filepath) != size:
+            return False
+    return True
+
+
+def record(dirpath, view, file, time, hash, passes=(), **extra):
+    entry = {
+        'view': view,
+        'file': file,
+        'size': path.getsize(path.join(dirpath, file)),
+        'time': round(time, 3),
+        'hash': hash}
+    if passes:
+        entry['passes'] = [
+            (f, path.getsize(path.join(dirpath, f))) for f in passes]
+    entry.update(extra)
+    with open(path.join(dirpath, FILENAME), 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+    return entry
@@ -0,0 +1,170 @@
+"""Per-view timing and resource metrics of a light field render.
+
+    python metrics.py /tmp/lf/
+
+Every rendered view appends one json line to ``metrics.jsonl`` next to
+``param.txt`` with the seconds spent in each phase (scene sync, render,
+composite and write), the idle gap before it, the peak resident memory of
+the process so far and the bytes written. The phases are told apart by the
+status lines blender reports while it renders. Run as a script it prints
+the summary of a finished or running render.
+"""
+import argparse
+import json
+import os
+import os.path as path
+import sys
+import time
+
+FILENAME = 'metrics.jsonl'
+PHASES = ['sync', 'render', 'composite', 'write']
+
+
+def phase(stats):
+    """phase of a render_stats line of cycles or eevee, None if unknown"""
+    stats = stats.lower()
+    if 'composit' in stats:
+        return 'composite'
+    if any(key in stats for key in ['sync', 'loading', 'updating', 'building',
+                                    'preparing', 'initializing', 'compil']):
+        return 'sync'
+    if any(key in stats for key in ['sample', 'rendering', 'path tracing',
+                                    'denois', 'tile']):
+        return 'render'
+    return None
+
+
+class Phases(object):
+    """wall time of the phases of one render, from the switches between them;
+    time before the first switch counts as scene sync"""
+    def __init__(self):
+        self.current = 'sync'
+        self.since = time.perf_counter()
+        self.times = dict.fromkeys(PHASES, 0.0)
+
+    def enter(self, phase):
+        now = time.perf_counter()
+        if phase is None or phase == self.current:
+            return
+        self.times[self.current] += now - self.since
+        self.current, self.since = phase, now
+
+    def stop(self):
+        self.times[self.current] += time.perf_counter() - self.since
+        self.since = time.perf_counter()
+        return dict(self.times)
+
+
+def peak_rss():
+    """peak resident memory of this process in bytes, None without resource"""
+    try:
+        import resource
+    except ImportError: # windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def current_rss():
+    """resident memory of this process right now in bytes, None where
+    /proc is missing"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Log(object):
+    def __init__(self, dirpath):
+        self.filepath = path.join(dirpath, FILENAME)
+        self.entries = []
+
+    def add(self, view, phases, **extra):
+        entry = {'view': view, 'time': time.time(),
+                 **{k: round(v, 4) for k, v in phases.items()}, **extra}
+        self.entries.append(entry)
+        with open(self.filepath, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        return entry
+
+
+def load(dirpath):
+    entries = []
+    filepath = path.join(dirpath, FILENAME)
+    if not path.exists(filepath):
+        return entries
+    with open(filepath) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError: # a line cut short by a crash
+                continue
+    return entries
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values)-1, int(round(q / 100 * (len(values)-1))))]
+
+
+def summary(entries, remaining=0, slowest=5):
+    """mean and p95 of every phase, the slowest views and the projected
+    completion of the remaining views"""
+    if not entries:
+        return {'views': 0}
+    totals = [sum(e.get(p, 0) for p in PHASES) for e in entries]
+    result = {'views': len(entries)}
+    for key in PHASES + ['gap']:
+        values = [e.get(key) or 0 for e in entries]
+        result[key] = {'mean': sum(values) / len(values),
+                       'p95': percentile(values, 95)}
+    mean = sum(totals) / len(totals)
+    result['total'] = {'mean': mean, 'p95': percentile(totals, 95)}
+    result['slowest'] = [
+        [e['view'], round(t, 3)]
+        for t, e in sorted(zip(totals, entries), key=lambda x: -x[0])[:slowest]]
+    result['bytes'] = sum(e.get('bytes') or 0 for e in entries)
+    rss = [e['rss'] for e in entries if e.get('rss')]
+    result['peak_rss'] = max(rss) if rss else None
+    result['remaining'] = remaining
+    gap = result['gap']['mean']
+    result['projected_seconds'] = remaining * (mean + gap)
+    result['projected_completion'] = time.strftime(
+        '%Y-%m-%d %H:%M:%S',
+        time.localtime(time.time() + result['projected_seconds']))
+    return result
+
+
+def report(result):
+    if not result['views']:
+        return 'no views rendered'
+    lines = [f"{result['views']} views, "
+             f"{result['total']['mean']:.2f} s mean, "
+             f"{result['total']['p95']:.2f} s p95"]
+    lines.append('  '.join(
+        f"{key} {result[key]['mean']:.2f}/{result[key]['p95']:.2f} s"
+        for key in PHASES + ['gap']) + ' (mean/p95)')
+    lines.append('slowest: ' + ', '.join(
+        f'{view} {t:.2f} s' for view, t in result['slowest']))
+    rss = result['peak_rss']
+    lines.append(f"{result['bytes'] / 2**20:.1f} MiB written, peak rss "
+                 + (f'{rss / 2**20:.0f} MiB' if rss else 'unknown'))
+    if result['remaining']:
+        lines.append(f"{result['remaining']} views left, done in "
+                     f"{result['projected_seconds']:.0f} s at "
+                     f"{result['projected_completion']}")
+    return '\n'.join(lines)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('dirpath', help='directory of the rendered light field')
+    parser.add_argument('--remaining', type=int, default=0,
+                        help='views left to render, for the projection')
+    args = parser.parse_args(argv)
+    print(report(summary(load(args.dirpath), args.remaining)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,183 @@
+"""Light fields packed into one chunked (rows, cols, H, W, C) array.
+
+    python pack.py /tmp/lf/ [--compression zstd] [--chunks 1 1 64 64 4]
+
+Without compression the views go into a memory-mapped ``lightfield.npy``,
+with compression into a chunked ``lightfield.zarr`` (needs zarr/numcodecs).
+Either way ``lightfield.json`` describes the array and the camera geometry
+recorded in ``param.txt``. Like every array of the addon, the rows of a view
+are in blender's order, bottom row first.
+"""
+import argparse
+import json
+import os
+import os.path as path
+import re
+import sys
+
+import numpy as np
+
+if __package__:
+    from . import image
+else: # run as a script
+    import image
+
+HEADER = 'lightfield.json'
+
+
+def read_params(dirpath):
+    params = {}
+    filepath = path.join(dirpath, 'param.txt')
+    if not path.exists(filepath):
+        return params
+    with open(filepath) as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            value = value.strip()
+            try:
+                value = int(value)
+            except ValueError:
+                try:
+                    value = float(value)
+                except ValueError:
+                    pass
+            params[key.strip()] = value
+    return params
+
+
+def view_files(dirpath, rows, cols):
+    # the colour image of a view is the only file named exactly {s:02}_{t:02}
+    files = {}
+    for file in os.listdir(dirpath):
+        m = re.fullmatch(r'(\d+)_(\d+)\.\w+', file)
+        if m and int(m.group(1)) < rows and int(m.group(2)) < cols:
+            files[int(m.group(1)), int(m.group(2))] = path.join(dirpath, file)
+    return files
+
+
+class Packer(object):
+    """writes views into the container as they arrive, the array is created
+    from the shape of the first view"""
+    def __init__(self, dirpath, grid, params=None, dtype='float32',
+                 chunks=None, compression=None):
+        self.dirpath = dirpath
+        self.grid = tuple(grid)
+        self.params = params or {}
+        self.dtype = np.dtype(dtype)
+        self.chunks = chunks
+        self.compression = compression
+        self.data = None
+
+    def create(self, shape):
+        shape = self.grid + tuple(shape)
+        if self.compression is None:
+            self.format = 'npy'
+            filepath = path.join(self.dirpath, 'lightfield.npy')
+            # resume into an existing array of the same layout
+            if path.exists(filepath):
+                data = np.load(filepath, mmap_mode='r+')
+                if data.shape == shape and data.dtype == self.dtype:
+                    return data
+            return np.lib.format.open_memmap(
+                filepath, mode='w+', dtype=self.dtype, shape=shape)
+        import zarr
+        from numcodecs import Blosc
+        self.format = 'zarr'
+        cname, _, level = self.compression.partition(':')
+        chunks = self.chunks or (1, 1, 64, 64, shape[-1])
+        return zarr.open_array(
+            path.join(self.dirpath, 'lightfield.zarr'), mode='a',
+            shape=shape, chunks=chunks, dtype=self.dtype,
+            compressor=Blosc(cname=cname, clevel=int(level or 5),
+                             shuffle=Blosc.BITSHUFFLE))
+
+    def add(self, s, t, view):
+        if view.ndim == 2:
+            view = view[..., None]
+        if self.data is None:
+            self.data = self.create(view.shape)
+            self.write_header()
+        self.data[s, t] = view
+
+    def write_header(self):
+        header = {
+            'format': self.format,
+            'file': f'lightfield.{self.format}',
+            'shape': list(self.data.shape),
+            'dtype': self.dtype.name,
+            'chunks': list(self.data.chunks if self.format == 'zarr'
+                           else (1, 1) + self.data.shape[2:]),
+            'compression': self.compression,
+            'params': self.params}
+        with open(path.join(self.dirpath, HEADER), 'w') as f:
+            json.dump(header, f, indent=2)
+
+    def close(self):
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+
+
+def pack(dirpath, dtype='float32', chunks=None, compression=None):
+    params = read_params(dirpath)
+    grid = (params.get('num_y', 1), params.get('num_x', 1))
+    packer = Packer(dirpath, grid, params, dtype, chunks, compression)
+    files = view_files(dirpath, *grid)
+    for (s, t), filepath in sorted(files.items()):
+        packer.add(s, t, image.read(filepath))
+    packer.close()
+    missing = grid[0] * grid[1] - len(files)
+    if missing:
+        print(f'{missing} views of the {grid[0]}x{grid[1]} grid are missing')
+    return packer
+
+
+class LightField(object):
+    """read access to a packed light field, only the requested part of the
+    array is read (npy) or decoded (zarr)"""
+    def __init__(self, dirpath):
+        with open(path.join(dirpath, HEADER)) as f:
+            self.header = json.load(f)
+        filepath = path.join(dirpath, self.header['file'])
+        if self.header['format'] == 'npy':
+            self.data = np.load(filepath, mmap_mode='r')
+        else:
+            import zarr
+            self.data = zarr.open_array(filepath, mode='r')
+        self.params = self.header['params']
+        self.grid = tuple(self.data.shape[:2])
+        self.shape = tuple(self.data.shape[2:])
+
+    def __getitem__(self, index):
+        return np.asarray(self.data[index])
+
+    def view(self, s, t):
+        """sub-aperture image (H, W, C)"""
+        return self[s, t]
+
+    def epi_h(self, s, y):
+        """horizontal epipolar plane image (cols, W, C) of row s at pixel row y"""
+        return self[s, :, y]
+
+    def epi_v(self, t, x):
+        """vertical epipolar plane image (rows, H, C) of column t at pixel column x"""
+        return self[:, t, :, x]
+
+    def patch(self, y0, y1, x0, x1):
+        """pixel patch across all views (rows, cols, y1-y0, x1-x0, C)"""
+        return self[:, :, y0:y1, x0:x1]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('dirpath', help='directory of the rendered light field')
+    parser.add_argument('--dtype', default='float32')
+    parser.add_argument('--chunks', type=int, nargs=5, default=None,
+                        help='zarr chunk shape (rows, cols, H, W, C)')
+    parser.add_argument('--compression', default=None,
+                        help='blosc codec and level, e.g. zstd:5 or lz4')
+    args = parser.parse_args(argv)
+    pack(args.dirpath, args.dtype, args.chunks, args.compression)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,5 +1,6 @@
 import bpy
-from .render import RenderLightField, RenderDisparity
+from .render import RenderLightField, RenderDisparity, RenderDisparityVolume, \
+    EstimateLightField
 from .util import create_plane
 
 def register():
@@ -102,6 +103,30 @@ class LFProperty(bpy.types.PropertyGroup):
         default=0,
         description='the minimum disparity')
 
+    layout: bpy.props.EnumProperty(
+        name='layout',
+        items=[
+            ('GRID', 'Grid', 'regular rectangular grid'),
+            ('HEX', 'Hexagonal', 'grid with every odd row shifted by half a column'),
+            ('RING', 'Rings', 'rows concentric rings of cols cameras'),
+            ('SPIRAL', 'Spiral', 'rows x cols cameras on a sunflower spiral'),
+            ('POINTS', 'Points', 'one camera per vertex of a mesh, in plane coordinates')],
+        default='GRID',
+        description='sampling pattern of the camera array')
+    focus: bpy.props.FloatProperty(
+        name='focus',
+        default=10,
+        min=1e-3,
+        unit='LENGTH',
+        description='distance of the zero-disparity plane the views of an '
+                    'off-axis render converge on')
+    points: bpy.props.PointerProperty(
+        type=bpy.types.Object,
+        name='points',
+        poll=(lambda self, object: object.type=='MESH'),
+        description='mesh whose vertex x, y are the camera plane coordinates '
+                    'in units of the baselines')
+
     plane: bpy.props.PointerProperty(
         type=bpy.types.Object,
         name='plane',
@@ -132,15 +157,27 @@ class LFPanel(bpy.types.Panel):
         row = layout.row(align=True)
         row.prop(lf, 'base_x')
         row.prop(lf, 'base_y')
+        layout.prop(lf, 'layout')
+        if lf.layout == 'POINTS':
+            layout.prop(lf, 'points')
+        layout.prop(lf, 'focus')
         layout.separator()
         layout.operator(
             RenderLightField.bl_idname,
             text='Render LightField',
             icon='SCENE')
+        layout.operator(
+            EstimateLightField.bl_idname,
+            text='Estimate Render Cost',
+            icon='TIME')
         layout.operator(
             RenderDisparity.bl_idname,
             text='Render Disparity Map',
             icon='SCENE')
+        layout.operator(
+            RenderDisparityVolume.bl_idname,
+            text='Render Disparity Volume',
+            icon='SCENE')
         if lf.max_disp > 0:
             row = layout.row(align=True)
             row.enabled = False
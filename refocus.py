@@ -0,0 +1,142 @@
+"""Shift-and-add refocusing of a rendered light field.
+
+A view at plane coordinates (u, v) (see layout.py) sees a point of disparity
+d, in pixels per base_x as recorded in lf.min_disp/max_disp, shifted by
+u * d pixels along x and by -v * d * base_y / base_x along the rows, which
+are in blender's bottom-up order. Shifting every view back and averaging
+brings the plane of that disparity into focus. Off-axis renders already
+converge on the plane of disparity_offset, which is subtracted. Views are
+read block by block, so only `block` views are in memory at a time.
+"""
+import json
+import os.path as path
+
+import numpy as np
+
+if __package__:
+    from . import calib, image, layout, pack
+else: # run as a script
+    import calib, image, layout, pack
+
+
+class Views(object):
+    """the views of a rendered light field with their plane coordinates,
+    read from a packed container when there is one"""
+    def __init__(self, dirpath):
+        self.dirpath = dirpath
+        if path.exists(path.join(dirpath, pack.HEADER)):
+            self.lightfield = pack.LightField(dirpath)
+            self.params = self.lightfield.params
+        else:
+            self.lightfield = None
+            self.params = pack.read_params(dirpath)
+        rows, cols = self.params.get('num_y', 1), self.params.get('num_x', 1)
+        self.grid = (rows, cols)
+        kind = self.params.get('layout', 'GRID')
+        if calib.exists(dirpath): # also knows the points of a POINTS layout
+            self.uv = np.asarray(calib.load(dirpath)[1]['uv'])
+        elif kind in layout.LAYOUTS:
+            self.uv = layout.LAYOUTS[kind](rows, cols)
+        else:
+            raise ValueError(f'plane coordinates of a {kind} layout are unknown')
+        base_x = self.params.get('base_x', 1) or 1
+        self.ratio = self.params.get('base_y', base_x) / base_x
+        self.offset = self.params.get('disparity_offset', 0)
+        if self.lightfield is None:
+            self.files = pack.view_files(dirpath, rows, cols)
+
+    def __len__(self):
+        return self.grid[0] * self.grid[1]
+
+    def view(self, index):
+        s, t = divmod(index, self.grid[1])
+        if self.lightfield is not None:
+            return self.lightfield.view(s, t)
+        return image.read(self.files[s, t])
+
+    def block(self, indices):
+        return np.stack([self.view(i) for i in indices])
+
+    def disparity_range(self):
+        # the statistics of a disparity volume, else the range calib.json
+        # recorded: those statistics again or the camera's min/max_disp
+        filepath = path.join(self.dirpath, 'disparity.json')
+        if path.exists(filepath):
+            with open(filepath) as f:
+                stats = json.load(f)
+        elif calib.exists(self.dirpath):
+            stats = calib.load(self.dirpath)[0]['disparity']
+        else:
+            raise FileNotFoundError(f'{filepath} or {calib.HEADER}')
+        stats = stats.get('x', stats)
+        return stats['min'], stats['max']
+
+
+def aperture(uv, size=1.0, shape='DISK'):
+    """weight of every view for a synthetic aperture of the given size,
+    relative to the extent of the camera plane"""
+    u, v = np.abs(uv).T
+    if shape == 'DISK':
+        return (np.hypot(u, v) <= size + 1e-9).astype(np.float32)
+    if shape == 'SQUARE':
+        return (np.maximum(u, v) <= size + 1e-9).astype(np.float32)
+    if shape == 'GAUSSIAN':
+        return np.exp(-(u**2 + v**2) / (2 * size**2)).astype(np.float32)
+    raise ValueError(f'unknown aperture shape {shape}')
+
+
+def accumulate(acc, weight, padded, mask, pad, ty, tx, w):
+    # acc += w * view sampled at (y + ty, x + tx), bilinear, zero outside
+    H, W = acc.shape[:2]
+    iy, ix = int(np.floor(ty)), int(np.floor(tx))
+    fy, fx = ty - iy, tx - ix
+    for dy, dx, c in [(0, 0, (1-fy)*(1-fx)), (0, 1, (1-fy)*fx),
+                      (1, 0, fy*(1-fx)), (1, 1, fy*fx)]:
+        if c == 0:
+            continue
+        y0, x0 = pad + iy + dy, pad + ix + dx
+        acc += (w * c) * padded[y0:y0+H, x0:x0+W]
+        weight += (w * c) * mask[y0:y0+H, x0:x0+W]
+
+
+def focal_stack(views, disparities, size=1.0, shape='DISK', block=8):
+    """one refocused (H, W, C) image per disparity, as a (D, H, W, C) array"""
+    disparities = np.atleast_1d(np.asarray(disparities, dtype=np.float64))
+    disparities = disparities - getattr(views, 'offset', 0)
+    weights = aperture(views.uv, size, shape)
+    indices = np.flatnonzero(weights > 1e-6)
+    # the largest shift of any view decides the padding
+    shift = np.abs(disparities).max() * np.abs(views.uv).max(axis=0)
+    pad = int(np.ceil(max(shift[0], shift[1] * abs(views.ratio)))) + 1
+    acc = weight = None
+    for start in range(0, len(indices), block):
+        batch = indices[start:start+block]
+        data = views.block(batch).astype(np.float32, copy=False)
+        if data.ndim == 3:
+            data = data[..., None]
+        B, H, W, C = data.shape
+        if acc is None:
+            acc = np.zeros((len(disparities), H, W, C), dtype=np.float32)
+            weight = np.zeros((len(disparities), H, W, 1), dtype=np.float32)
+            mask = np.pad(np.ones((H, W, 1), np.float32), ((pad, pad),)*2 + ((0, 0),))
+        padded = np.pad(data, ((0, 0), (pad, pad), (pad, pad), (0, 0)))
+        for view, index in zip(padded, batch):
+            u, v = views.uv[index]
+            for k, d in enumerate(disparities):
+                accumulate(acc[k], weight[k], view, mask, pad,
+                           -v * d * views.ratio, u * d, weights[index])
+    if acc is None:
+        raise ValueError('the aperture contains no view')
+    return acc / np.maximum(weight, 1e-12)
+
+
+def refocus(views, disparity, size=1.0, shape='DISK', block=8):
+    """the light field focused on the plane of the given disparity"""
+    return focal_stack(views, [disparity], size, shape, block)[0]
+
+
+def focal_sweep(views, num=16, size=1.0, shape='DISK', block=8):
+    """focal stack over the disparity range of the rendered scene"""
+    low, high = views.disparity_range()
+    disparities = np.linspace(low, high, num)
+    return disparities, focal_stack(views, disparities, size, shape, block)
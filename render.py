@@ -1,19 +1,40 @@
 import bpy
 import os
 import os.path as path
-import numpy as np
+import json
+import functools
+import shutil
+import tempfile
+import time
+from mathutils import Vector
 from . import util
+from . import manifest
+from . import metrics
+# numpy and the modules that need it load on the first render
+np = util.lazy('numpy')
+pack = util.lazy('.pack')
+writer = util.lazy('.writer')
+layout = util.lazy('.layout')
+synth = util.lazy('.synth')
+denoise = util.lazy('.denoise')
+calib = util.lazy('.calib')
+fingerprint = util.lazy('.fingerprint')
+estimate = util.lazy('.estimate')
 
 
 def register():
     bpy.utils.register_class(RenderLightField)
     bpy.utils.register_class(RenderGeometry)
     bpy.utils.register_class(RenderDisparity)
+    bpy.utils.register_class(RenderDisparityVolume)
+    bpy.utils.register_class(EstimateLightField)
 
 def unregister():
     bpy.utils.unregister_class(RenderLightField)
     bpy.utils.unregister_class(RenderGeometry)
     bpy.utils.unregister_class(RenderDisparity)
+    bpy.utils.unregister_class(RenderDisparityVolume)
+    bpy.utils.unregister_class(EstimateLightField)
 
 class RenderGeometry(bpy.types.Operator):
     bl_idname = "render.geometry"
@@ -50,10 +71,13 @@ class RenderGeometry(bpy.types.Operator):
                     f'{type}{scene.frame_current:04d}.exr')
                 images = bpy.data.images
                 key = f'geo_{type}'
-                if images.get(key):
-                    images.remove(images[key])
-                image = images.load(filepath, check_existing=False)
-                image.name = key
+                image = images.get(key)
+                if image:
+                    image.filepath = filepath
+                    image.reload()
+                else:
+                    image = images.load(filepath, check_existing=False)
+                    image.name = key
 
     # def invoke(self, context, event):
     #     context.window_manager.modal_handler_add(self)
@@ -86,8 +110,7 @@ class RenderDisparity(bpy.types.Operator):
         # from imageio import imwrite, imread
         cam = context.scene.camera
         images = bpy.data.images
-        im_depth = images['geo_depth']
-        z = util.imread(im_depth.filepath)[...,0]
+        z = util.pixels(images['geo_depth'], channels=0)
         b = cam.lightfield.base_x
         # TODO: check all units
         f = cam.data.lens # focal length
@@ -134,88 +157,1396 @@ class RenderDisparity(bpy.types.Operator):
         self.clear(context)
         return {'FINISHED'}
 
+class RenderDisparityVolume(RenderDisparity):
+    bl_idname = "render.disparity_volume"
+    bl_label = "render light field disparity of every view"
+
+    half: bpy.props.BoolProperty(
+        default=False,
+        description='store the disparity as float16')
+    percentiles: bpy.props.FloatVectorProperty(
+        size=2, default=(1, 99), min=0, max=100,
+        description='percentiles of the disparity kept as min/max disparity')
+    samples: bpy.props.IntProperty(
+        default=1 << 16, min=1,
+        description='disparity values per view kept for the statistics')
+
+    def disparity(self, context):
+        scene = context.scene
+        cam = scene.camera
+        lf = cam.lightfield
+        poses = util.CamPoses(cam)
+        S, T = poses.grid
+        W, H = util.resolution(scene)
+        f = util.focal_px(scene, cam)
+        dirpath = bpy.path.abspath(scene.render.filepath)
+        os.makedirs(dirpath, exist_ok=True)
+        dtype = np.float16 if self.half else np.float32
+        # written view by view, the volume never has to fit into memory
+        volumes = [
+            (np.lib.format.open_memmap(
+                path.join(dirpath, f'disparity_{axis}.npy'), mode='w+',
+                dtype=dtype, shape=(S, T, H, W)), base)
+            for axis, base in [('x', lf.base_x), ('y', lf.base_y)]]
+        samples = []
+        try:
+            for index in range(len(poses)):
+                s, t = poses.idx2pos(index)
+                print(f'disparity of {s:02}_{t:02}')
+                cam.location = poses[index]
+                bpy.ops.render.geometry()
+                z = util.pixels(bpy.data.images['geo_depth'], channels=0)
+                # the background is at infinity, it has zero disparity but
+                # must not count towards the disparity range of the scene
+                valid = np.isfinite(z) & (z > 0) & (z < cam.data.clip_end)
+                disparity = np.where(valid, f / np.where(valid, z, 1), 0)
+                for volume, base in volumes:
+                    volume[s, t] = disparity * base
+                values = disparity[valid]
+                step = max(1, values.size // self.samples)
+                samples.append(values[::step])
+        finally:
+            cam.location = poses.pos
+        for volume, _ in volumes:
+            volume.flush()
+        self.statistics(context, np.concatenate(samples), dirpath, f)
+
+    def statistics(self, context, samples, dirpath, f):
+        lf = context.scene.camera.lightfield
+        stats = {
+            'focal_px': f,
+            'percentiles': list(self.percentiles),
+            'dtype': 'float16' if self.half else 'float32'}
+        for axis, base in [('x', lf.base_x), ('y', lf.base_y)]:
+            if samples.size == 0:
+                low = high = 0.0
+            else:
+                low, high = np.percentile(samples * base, self.percentiles)
+            stats[axis] = {'base': base, 'min': float(low), 'max': float(high)}
+        lf.min_disp = stats['x']['min']
+        lf.max_disp = stats['x']['max']
+        with open(path.join(dirpath, 'disparity.json'), 'w') as f:
+            json.dump(stats, f, indent=2)
+
+    def execute(self, context):
+        # every view renders its own depth, not the centre view first
+        self.init(context)
+        try:
+            self.disparity(context)
+        finally:
+            self.clear(context)
+        return {'FINISHED'}
+
 
 class RenderLightField(bpy.types.Operator):
     bl_idname = "render.lightfield"
     bl_label = "render light field"
 
     path: bpy.props.StringProperty(default='')
+    shard: bpy.props.IntProperty(
+        default=0, min=0,
+        description='index of the subset of views rendered by this process')
+    num_shards: bpy.props.IntProperty(
+        default=1, min=1,
+        description='number of processes the camera grid is split across')
+    persistent: bpy.props.BoolProperty(
+        default=False,
+        description='keep render data between views and only move the '
+                    'camera, where the render engine supports it')
+    block_size: bpy.props.IntProperty(
+        default=1, min=1,
+        description='number of views rendered together in one multiview '
+                    'render, each from its own temporary camera')
+    geometry: bpy.props.BoolProperty(
+        default=False,
+        description='write the passes of the geometry panel (depth by '
+                    'default) next to every view in the same render')
+    pack: bpy.props.BoolProperty(
+        default=False,
+        description='stream the views into one (rows, cols, H, W, C) array '
+                    'while rendering')
+    pack_compression: bpy.props.StringProperty(
+        default='',
+        description='blosc codec[:level] of a compressed zarr container, '
+                    'a memory-mapped .npy when empty')
+    async_write: bpy.props.BoolProperty(
+        default=False,
+        description='encode and write the views on background threads while '
+                    'the next view renders')
+    writers: bpy.props.IntProperty(
+        default=2, min=1,
+        description='number of background writer threads')
+    max_pending: bpy.props.IntProperty(
+        default=4, min=1,
+        description='number of finished views waiting to be written before '
+                    'rendering blocks')
+    sparse_step: bpy.props.IntProperty(
+        default=1, min=1,
+        description='render every n-th row and column and the corners, the '
+                    'views in between are synthesized from their depth')
+    max_holes: bpy.props.FloatProperty(
+        default=0.02, min=0, max=1,
+        description='fraction of disoccluded pixels above which a '
+                    'synthesized view is rendered in full, not just its holes')
+    animation: bpy.props.BoolProperty(
+        default=False,
+        description='render every frame of the scene\'s frame range into '
+                    '{frame:04d}/{s:02}_{t:02}')
+    order: bpy.props.EnumProperty(
+        items=[('FRAME', 'Frame', 'all views of a frame before the next frame, '
+                'the scene is evaluated once per frame'),
+               ('VIEW', 'View', 'one view through all frames before the next '
+                'view, the camera stays in place')],
+        default='FRAME',
+        description='order of the views and frames of an animation')
+    view_order: bpy.props.EnumProperty(
+        items=[('RASTER', 'Raster', 'row by row'),
+               ('CENTER', 'Centre', 'nearest to the centre of the plane first'),
+               ('BISECT', 'Bisect', 'the corners, then always halfway '
+                'between the views before'),
+               ('HALTON', 'Halton', 'low-discrepancy, evenly spread over '
+                'the plane at any point of the render')],
+        default='RASTER',
+        description='order the views are rendered in')
+    progressive: bpy.props.BoolProperty(
+        default=False,
+        description='render the whole grid at preview_scale into preview/ '
+                    'first, then every view at full quality')
+    preview_scale: bpy.props.FloatProperty(
+        default=0.25, min=0.01, max=1,
+        description='fraction of the resolution and samples of the preview '
+                    'of a progressive render')
+    off_axis: bpy.props.BoolProperty(
+        default=False,
+        description='shift the sensor of every view so all views converge '
+                    'on the zero-disparity plane at the camera\'s focus')
+    crop: bpy.props.BoolProperty(
+        default=False,
+        description='only render the part of an off-axis view that every '
+                    'view of the grid sees')
+    incremental: bpy.props.BoolProperty(
+        default=False,
+        description='only render again the tiles of finished views that see '
+                    'objects changed since the last render')
+    tile_size: bpy.props.IntProperty(
+        default=64, min=8,
+        description='pixel size of the tiles incremental and adaptive '
+                    'renders snap to')
+    max_patch: bpy.props.FloatProperty(
+        default=0.5, min=0, max=1,
+        description='fraction of a view above which an incremental or '
+                    'adaptive render renders the whole view instead of '
+                    'patching it')
+    adaptive: bpy.props.BoolProperty(
+        default=False,
+        description='render with a fraction of the samples, denoise every '
+                    'view with its neighbours and render the tiles that '
+                    'stay noisy again with all samples')
+    sample_fraction: bpy.props.FloatProperty(
+        default=0.25, min=0.01, max=1,
+        description='fraction of the render samples of an adaptive render')
+    noise_threshold: bpy.props.FloatProperty(
+        default=0.02, min=0,
+        description='relative standard error of a denoised tile above which '
+                    'it is rendered again with all samples')
+
+    def params(self):
+        lf = self.camera.lightfield
+        return {
+            'cmera': self.camera.name,
+            'num_x': self.poses.grid[1],
+            'num_y': self.poses.grid[0],
+            'base_x': lf.base_x,
+            'base_y': lf.base_y,
+            'layout': lf.layout,
+            **self.frame_range,
+            **self.convergence}
 
     def write_meta(self, context):
-        lf = context.scene.camera.lightfield
+        os.makedirs(self.path, exist_ok=True)
         with open(path.join(self.path, 'param.txt'), 'w') as f:
-            f.write(f'cmera: {context.scene.camera.name}\n')
-            f.write(f'num_x: {lf.num_cols}\n')
-            f.write(f'num_y: {lf.num_rows}\n')
-            f.write(f'base_x: {lf.base_x}\n')
-            f.write(f'base_y: {lf.base_y}\n')
+            for key, value in self.params().items():
+                f.write(f'{key}: {value}\n')
+        calib.write(self.path, *self.calibration(context.scene))
+
+    def name(self, index, frame=None):
+        if frame is None:
+            return self.poses.name(index)
+        return f'{frame:04d}/{self.poses.name(index)}'
+
+    def frames(self, scene):
+        if not self.animation:
+            return [None]
+        return list(range(scene.frame_start, scene.frame_end+1, scene.frame_step))
+
+    def set_frame(self, scene, frame):
+        # the camera may be animated, so its poses follow the frame
+        if frame is None or frame == self.frame:
+            return
+        self.frame = frame
+        scene.frame_set(frame)
+        cam = self.camera
+        self.poses = util.CamPoses(cam)
+        self.parent = (cam.matrix_world @ cam.matrix_basis.inverted()).to_3x3().inverted()
+
+    def place(self, cam, index):
+        # fcurves set the location on every evaluation of an animated camera,
+        # the offset of the view goes on top of it as delta_location
+        if self.animation:
+            cam.delta_location = self.delta_location + \
+                self.parent @ Vector(self.poses.offsets[index])
+        else:
+            cam.location = self.poses[index]
+        if self.off_axis:
+            cam.data.shift_x, cam.data.shift_y = self.view_shift(index)
+
+    def view_hash(self, scene, index):
+        rotation = self.camera.matrix_world.to_3x3()
+        shift = self.view_shift(index) if self.off_axis else None
+        return manifest.settings_hash(scene, self.poses[index], rotation, shift)
+
+    def flush_pack(self):
+        # reading images back is only safe on the main thread, not in post
+        if self.async_write: # written() appends from the writer threads
+            with self.writer.lock:
+                unpacked, self.unpacked = self.unpacked, []
+        else:
+            unpacked, self.unpacked = self.unpacked, []
+        for s, t, filepath in unpacked:
+            self.packer.add(s, t, util.imread(filepath)[..., :self.channels])
+
+    def next(self, scene):
+        # move the camera and output to the next views, before they are rendered
+        self.flush_pack()
+        frame = self.todo[self.progress][0]
+        self.batch = []
+        for f, i in self.todo[self.progress:self.progress+self.block_size]:
+            if f != frame: # a block never spans two frames
+                break
+            self.batch.append(i)
+        self.set_frame(scene, frame)
+        self.hashes = {i: self.view_hash(scene, i) for i in self.batch}
+        if self.block_size > 1:
+            self.next_block(scene)
+            return
+        index = self.batch[0]
+        name = self.name(index, self.frame)
+        scene.render.filepath = path.join(self.path, name)
+        self.place(scene.camera, index)
+        if self.use_geometry:
+            node = scene.node_tree.nodes['GeoFile']
+            for input, slot in zip(node.inputs, node.file_slots):
+                slot.path = f'{name}_{input.name}'
+
+    def next_block(self, scene):
+        # every view of the block gets a camera named prefix + view suffix,
+        # which blender's multiview picks up from the active camera's name
+        self.clear_block(scene)
+        prefix = f'LF_{self.camera.name}_'
+        for index in self.batch:
+            name = self.poses.name(index)
+            cam = self.camera.copy()
+            cam.name = prefix + name
+            if self.off_axis: # every view has its own shift
+                cam.data = self.camera.data.copy()
+            self.place(cam, index)
+            scene.collection.objects.link(cam)
+            self.cameras.append(cam)
+            view = scene.render.views.new(f'lf_{name}')
+            view.camera_suffix = name
+            self.views.append(view)
+        scene.camera = self.cameras[0]
+        scene.render.filepath = path.join(self.path, 'lf_')
+
+    def clear_block(self, scene):
+        for cam in self.cameras:
+            data = cam.data
+            bpy.data.objects.remove(cam, do_unlink=True)
+            if data != self.camera.data:
+                bpy.data.cameras.remove(data)
+        for view in self.views:
+            scene.render.views.remove(view)
+        self.cameras = []
+        self.views = []
+
+    def init_multiview(self, scene):
+        render = scene.render
+        self.multiview = {
+            'use_multiview': render.use_multiview,
+            'views_format': render.views_format,
+            'image_views_format': render.image_settings.views_format,
+            'views': {v.name: v.use for v in render.views}}
+        render.use_multiview = True
+        render.views_format = 'MULTIVIEW'
+        render.image_settings.views_format = 'INDIVIDUAL'
+        for view in render.views:
+            view.use = False
+
+    def clear_multiview(self, scene):
+        render = scene.render
+        self.clear_block(scene)
+        scene.camera = self.camera
+        render.use_multiview = self.multiview['use_multiview']
+        render.views_format = self.multiview['views_format']
+        render.image_settings.views_format = self.multiview['image_views_format']
+        for name, use in self.multiview['views'].items():
+            render.views[name].use = use
+
+    def shifts(self, scene, poses):
+        # sensor shift of every view in pixels, which moves the plane at
+        # focus onto the same pixels as in the centre view, and the border
+        # (x0, y0, x1, y1) of the pixels every view sees
+        lf = scene.camera.lightfield
+        offset = util.focal_px(scene, scene.camera) * lf.base_x / lf.focus
+        shifts = poses.uv * [offset, -offset * lf.base_y / lf.base_x]
+        W, H = util.resolution(scene)
+        low, high = shifts.min(axis=0), shifts.max(axis=0)
+        border = (max(0, int(np.ceil(-low[0]))), max(0, int(np.ceil(-low[1]))),
+                  min(W, int(np.floor(W - high[0]))),
+                  min(H, int(np.floor(H - high[1]))))
+        if not self.crop:
+            border = (0, 0, W, H)
+        return offset, shifts, border
+
+    def init_off_axis(self, scene):
+        cam = self.camera.data
+        render = scene.render
+        self.off_axis_setup = {
+            'shift': (cam.shift_x, cam.shift_y),
+            'border': (render.use_border, render.use_crop_to_border,
+                       render.border_min_x, render.border_min_y,
+                       render.border_max_x, render.border_max_y)}
+        self.disparity_offset, self.pixel_shifts, self.border = \
+            self.shifts(scene, self.poses)
+        self.shift_unit = util.sensor_fit(scene, self.camera)[0]
+        self.convergence = {'focus': self.camera.lightfield.focus,
+                            'disparity_offset': self.disparity_offset}
+        if self.crop:
+            W, H = util.resolution(scene)
+            x0, y0, x1, y1 = self.border
+            render.use_border = render.use_crop_to_border = True
+            render.border_min_x, render.border_max_x = x0 / W, x1 / W
+            render.border_min_y, render.border_max_y = y0 / H, y1 / H
+
+    def clear_off_axis(self, scene):
+        render = scene.render
+        self.camera.data.shift_x, self.camera.data.shift_y = \
+            self.off_axis_setup['shift']
+        (render.use_border, render.use_crop_to_border,
+         render.border_min_x, render.border_min_y,
+         render.border_max_x, render.border_max_y) = self.off_axis_setup['border']
+
+    def view_shift(self, index):
+        # in blender's unit of the sensor fit side, on top of the camera's
+        return tuple(np.add(self.off_axis_setup['shift'],
+                            self.pixel_shifts[index] / self.shift_unit))
+
+    def calibration(self, scene):
+        # per-view arrays and metadata of calib.py, the principal point is in
+        # pixels of the (cropped) output with the rows bottom up
+        lf = self.camera.lightfield
+        cam = self.camera.data
+        render = scene.render
+        W, H = util.resolution(scene)
+        x0, y0, x1, y1 = self.border if self.off_axis else (0, 0, W, H)
+        f = util.focal_px(scene, self.camera)
+        unit = util.sensor_fit(scene, self.camera)[0]
+        N = len(self.poses)
+        shifts = np.array([
+            self.view_shift(i) if self.off_axis else (cam.shift_x, cam.shift_y)
+            for i in range(N)]) * unit
+        K = np.zeros((N, 3, 3))
+        K[:, 0, 0] = K[:, 1, 1] = f
+        K[:, 0, 2] = W/2 - shifts[:, 0] - x0
+        K[:, 1, 2] = H/2 - shifts[:, 1] - y0
+        K[:, 2, 2] = 1
+        frames = [frame for frame in self.frame_poses if frame is not None]
+        if frames:
+            poses = np.stack([self.frame_poses[frame] for frame in frames])
+        else:
+            poses = self.frame_poses[None]
+        arrays = {
+            'uv': self.poses.uv,
+            'index': np.stack(np.divmod(np.arange(N), self.poses.grid[1]), -1),
+            'poses': poses,
+            'extrinsics': np.linalg.inv(poses),
+            'intrinsics': K}
+        disparity = {'min': lf.min_disp, 'max': lf.max_disp}
+        stats = path.join(self.path, 'disparity.json')
+        if path.exists(stats):
+            with open(stats) as file:
+                disparity.update(json.load(file))
+        cycles = getattr(scene, 'cycles', None)
+        meta = {
+            'camera': self.camera.name,
+            'grid': list(self.poses.grid),
+            'base_x': lf.base_x,
+            'base_y': lf.base_y,
+            'layout': lf.layout,
+            'focal_px': f,
+            'resolution': [x1 - x0, y1 - y0],
+            'full_resolution': [W, H],
+            'border': [x0, y0, x1, y1],
+            'clip': [cam.clip_start, cam.clip_end],
+            **self.convergence,
+            'frames': frames or None,
+            'disparity': disparity,
+            'render': {
+                'engine': render.engine,
+                'samples': cycles.samples if render.engine == 'CYCLES'
+                           else scene.eevee.taa_render_samples,
+                'resolution_percentage': render.resolution_percentage,
+                'pixel_aspect': [render.pixel_aspect_x, render.pixel_aspect_y],
+                'file_format': render.image_settings.file_format,
+                'color_mode': render.image_settings.color_mode,
+                'color_depth': render.image_settings.color_depth,
+                'view_transform': scene.view_settings.view_transform,
+                'look': scene.view_settings.look,
+                'exposure': scene.view_settings.exposure,
+                'gamma': scene.view_settings.gamma,
+                'frame': scene.frame_current,
+                'fps': render.fps / render.fps_base}}
+        return arrays, meta
+
+    def pass_files(self, name):
+        return [f'{name}_{type}.exr' for type in self.passes]
+
+    def update(self, scene, depsgraph):
+        # with persistent data only the camera (and its plane) may change
+        if not self.persistent or not scene.render.use_persistent_data:
+            return
+        lf = scene.camera.lightfield
+        for update in depsgraph.updates:
+            id = update.id.original
+            if isinstance(id, (bpy.types.Scene, bpy.types.Collection)):
+                continue
+            if id in (self.camera, lf.plane) or id in self.cameras:
+                continue
+            if isinstance(id, bpy.types.Camera): # lens or off-axis shift
+                continue
+            if self.animation and getattr(id, 'animation_data', None):
+                continue # changed by the frame
+            print(f'{id.name} changed during the light field render, '
+                  'persistent data disabled')
+            scene.render.use_persistent_data = False
+            return
 
     def pre(self, scene, *args):
-        print(f'render on {self.progress:03d}/{len(self.poses):03d}')
-        s, t = self.poses.idx2pos(self.progress)
-        save_path = path.join(self.path, f'{s:02}_{t:02}')
-        scene.render.filepath = save_path
-        scene.camera.location = self.poses[self.progress]
+        if self.finishing:
+            return
+        self.start = time.perf_counter()
+        self.phases = metrics.Phases()
+        self.gap = 0.0
+        gap = ''
+        if self.finished is not None:
+            self.gap = self.start - self.finished
+            gap = f' (idle {self.gap*1000:.1f} ms)'
+        frame = '' if self.frame is None else f' frame {self.frame}'
+        print(f'render on {self.progress:03d}/{len(self.todo):03d}{frame}{gap}')
         self.rendering = True
 
+    def stats(self, *args):
+        # the status line tells which phase the render is in
+        if self.rendering and not self.finishing:
+            stats = next((a for a in args if isinstance(a, str)), '')
+            self.phases.enter(metrics.phase(stats))
+
+    def rendered(self, scene, *args):
+        # render_post comes after compositing, before the image is written
+        if self.rendering and not self.finishing:
+            self.phases.enter('write')
+
+    def view_phases(self):
+        # the views of a block share the phases of its render
+        times = self.phases.stop()
+        return {k: v / len(self.batch) for k, v in times.items()}
+
     def post(self, scene, *args):
-        self.progress += 1
+        if self.finishing:
+            return
+        elapsed = (time.perf_counter() - self.start) / len(self.batch)
+        phases = self.view_phases()
+        for index in self.batch:
+            name = self.name(index, self.frame)
+            file = self.view_file(scene, name)
+            if self.block_size > 1:
+                os.makedirs(path.dirname(path.join(self.path, file)), exist_ok=True)
+                os.replace(path.join(self.path, 'lf_' + path.basename(file)),
+                           path.join(self.path, file))
+            self.rename_passes(scene, name)
+            self.written(index, name, file, elapsed, self.hashes[index],
+                         phases, self.gap)
+        self.advance()
+
+    def rename_passes(self, scene, name):
+        # the file output node always appends the frame number
+        for type, pass_file in zip(self.passes, self.pass_files(name)):
+            os.replace(
+                path.join(self.path,
+                          f'{name}_{type}{scene.frame_current:04d}.exr'),
+                path.join(self.path, pass_file))
+
+    def view_file(self, scene, name):
+        # relative to the output, frames are in sub directories
+        return path.relpath(
+            util.render_file(scene, path.join(self.path, name)), self.path)
+
+    def written(self, index, name, file, elapsed, hash,
+                phases=None, gap=0.0, write=None):
+        # a view is only recorded once all of its files are on disk
+        entry = manifest.record(
+            self.path, name, file, elapsed, hash, self.pass_files(name))
+        if phases is not None:
+            if write is not None: # measured by the writer thread
+                phases = dict(phases, write=write)
+            self.metrics.add(
+                name, phases, gap=round(gap, 4), rss=metrics.peak_rss(),
+                bytes=entry['size'] + sum(s for _, s in entry.get('passes', [])))
+        if self.packer:
+            self.unpacked.append(
+                (*self.poses.idx2pos(index), path.join(self.path, file)))
+
+    def advance(self):
+        self.progress += len(self.batch)
         self.rendering = False
-        self.done = self.progress >= len(self.poses)
+        self.done = self.progress >= len(self.todo)
+        self.finished = time.perf_counter()
+
+    def grab(self, scene):
+        # hand the composited pixels to the writer pool instead of write_still
+        elapsed = time.perf_counter() - self.start
+        phases = self.view_phases()
+        index = self.batch[0]
+        name = self.name(index, self.frame)
+        file = self.view_file(scene, name)
+        self.rename_passes(scene, name)
+        settings = scene.render.image_settings
+        data = util.pixels(bpy.data.images['Viewer Node'])
+        data = data[..., :{'BW': 1, 'RGB': 3}.get(settings.color_mode, 4)]
+        if settings.file_format != 'OPEN_EXR':
+            data = util.display(scene, data)
+        self.writer.submit(
+            path.join(self.path, file), data,
+            functools.partial(
+                self.written, index, name, file, elapsed, self.hashes[index],
+                phases, self.gap),
+            depth=settings.color_depth,
+            codec=getattr(settings, 'exr_codec', 'ZIP'))
+        self.advance()
+
+    def init_writer(self, scene):
+        # a viewer node behind the composite output exposes the final pixels
+        self.use_nodes = scene.use_nodes
+        scene.use_nodes = True
+        tree = scene.node_tree
+        composite = next(n for n in tree.nodes if n.type == 'COMPOSITE')
+        viewer = tree.nodes.new('CompositorNodeViewer')
+        viewer.name = 'LFViewer'
+        links = composite.inputs['Image'].links
+        if links:
+            source = links[0].from_socket
+        else: # an unconnected composite outputs the render layers as they are
+            source = next(
+                n for n in tree.nodes if n.type == 'R_LAYERS').outputs['Image']
+        tree.links.new(source, viewer.inputs['Image'])
+        # only the active viewer node writes 'Viewer Node'
+        tree.nodes.active = viewer
+        self.writer = writer.WriterPool(self.writers, self.max_pending)
+
+    def clear_writer(self, scene):
+        try:
+            self.writer.close()
+        finally:
+            nodes = scene.node_tree.nodes
+            nodes.remove(nodes['LFViewer'])
+            scene.use_nodes = self.use_nodes
+
+    def complete(self, scene, *args):
+        # render_complete runs on the render job's thread, where starting
+        # the next render is not allowed, so a timer chains it from the
+        # main thread
+        if self.window is None:
+            return
+        if not self.done:
+            bpy.app.timers.register(self.chain, first_interval=0)
+
+    def chain(self):
+        scene = self.window.scene
+        if self.async_write and self.rendering:
+            # the viewer pixels of the finished view are read and handed to
+            # the writers here on the main thread, not on the render job's
+            self.grab(scene)
+        if self.done or self.rendering:
+            return None
+        self.next(scene)
+        override = {'window': self.window, 'screen': self.window.screen,
+                    'scene': scene}
+        if hasattr(bpy.context, 'temp_override'):
+            with bpy.context.temp_override(**override):
+                result = bpy.ops.render.render(
+                    'INVOKE_DEFAULT', write_still=not self.async_write)
+        else:
+            result = bpy.ops.render.render(
+                override, 'INVOKE_DEFAULT', write_still=not self.async_write)
+        if 'CANCELLED' not in result:
+            self.retries = 0
+            return None
+        # the last render job is still closing; a render that does not start
+        # once no job runs any more stops the light field instead of polling
+        running = getattr(bpy.app, 'is_job_running', lambda job: False)
+        self.retries += 1
+        if running('RENDER') or self.retries < 100:
+            return 0.001
+        print(f'the render of view {self.progress} did not start, cancelled')
+        self.cancel(None)
+        return None
+
+    def render_view(self, scene, index, name, border=None):
+        # one blocking render of a view into files called name, only the
+        # (min_x, min_y, max_x, max_y) border of it when given
+        render = scene.render
+        self.place(scene.camera, index)
+        render.filepath = path.join(self.path, name)
+        if self.use_geometry:
+            node = scene.node_tree.nodes['GeoFile']
+            for input, slot in zip(node.inputs, node.file_slots):
+                slot.path = f'{name}_{input.name}'
+        keys = ['use_border', 'use_crop_to_border', 'border_min_x',
+                'border_min_y', 'border_max_x', 'border_max_y']
+        setup = [getattr(render, key) for key in keys]
+        if border is not None:
+            for key, value in zip(keys, (True, False) + tuple(border)):
+                setattr(render, key, value)
+        try:
+            bpy.ops.render.render(write_still=True)
+        finally:
+            for key, value in zip(keys, setup):
+                setattr(render, key, value)
+        self.rename_passes(scene, name)
+        return util.render_file(scene, path.join(self.path, name))
+
+    def render_tile(self, scene, index, rect, render=None):
+        # render the (x0, y0, x1, y1) pixels of a view's written image into
+        # temporary files, returns that tile of the colour and of every pass
+        render = render or self.render_view
+        W, H = util.resolution(scene)
+        ox, oy = self.border[:2] if self.off_axis and self.crop else (0, 0)
+        x0, y0, x1, y1 = rect
+        fill = render(scene, index, 'lf_fill', (
+            (x0 + ox) / W, (y0 + oy) / H, (x1 + ox) / W, (y1 + oy) / H))
+        tiles = []
+        for filepath in [fill] + [
+                path.join(self.path, f) for f in self.pass_files('lf_fill')]:
+            tiles.append(util.imread(filepath)[y0+oy:y1+oy, x0+ox:x1+ox])
+            os.remove(filepath)
+        return tiles
+
+    def source(self, scene, index):
+        # colour and disparity of a rendered key view
+        name = self.poses.name(index)
+        color = util.imread(util.render_file(scene, path.join(self.path, name)))
+        z = util.imread(path.join(self.path, f'{name}_depth.exr'), channels=0)
+        valid = np.isfinite(z) & (z > 0) & (z < self.camera.data.clip_end)
+        disparity = np.where(valid, self.focal_base / np.where(valid, z, 1), 0)
+        return color, disparity.astype(np.float32), self.poses.uv[index]
+
+    def synthesize(self, context):
+        # every view between the key views is warped from the nearest four,
+        # its holes are rendered as one border tile or the view in full
+        scene = context.scene
+        self.finishing = True
+        lf = self.camera.lightfield
+        self.focal_base = util.focal_px(scene, self.camera) * lf.base_x
+        ratio = lf.base_y / lf.base_x
+        uv = self.poses.uv
+        W, H = util.resolution(scene)
+        entries = manifest.load(self.path)
+        settings = scene.render.image_settings
+        counts = {'synthesized': 0, 'tiles': 0, 'rendered': 0}
+        start = time.perf_counter()
+        sources = {}
+        for index in range(len(self.poses)):
+            name = self.poses.name(index)
+            hash = self.view_hash(scene, index)
+            synth_hash = f'{hash}/sparse{self.sparse_step}'
+            depth_file = f'{name}_depth.exr'
+            entry = entries.get(name)
+            if index in self.keys:
+                continue
+            if manifest.valid(
+                    entry, self.path, hash, self.pass_files(name)) or \
+                    manifest.valid(entry, self.path, synth_hash, [depth_file]):
+                self.reused += 1
+                continue
+            view_start = time.perf_counter()
+            near = sorted(self.keys, key=lambda k: np.hypot(*(uv[k] - uv[index])))[:4]
+            sources = {k: sources.get(k) or self.source(scene, k) for k in near}
+            color, disparity, holes = synth.synthesize(
+                list(sources.values()), uv[index], ratio)
+            if holes.mean() > self.max_holes:
+                file = self.render_view(scene, index, name)
+                counts['rendered'] += 1
+                self.written(index, name, path.basename(file),
+                             time.perf_counter() - view_start, hash)
+                continue
+            if holes.any():
+                ys, xs = np.nonzero(holes)
+                margin = 4
+                x0, y0 = max(xs.min() - margin, 0), max(ys.min() - margin, 0)
+                x1 = min(xs.max() + 1 + margin, W)
+                y1 = min(ys.max() + 1 + margin, H)
+                fill, *passes = self.render_tile(scene, index, (x0, y0, x1, y1))
+                z = passes[self.passes.index('depth')][..., 0]
+                tile = holes[y0:y1, x0:x1]
+                color[y0:y1, x0:x1][tile] = fill[tile][:, :color.shape[-1]]
+                disparity[y0:y1, x0:x1][tile] = np.where(
+                    z[tile] < self.camera.data.clip_end,
+                    self.focal_base / np.maximum(z[tile], 1e-12), 0)
+                counts['tiles'] += 1
+            counts['synthesized'] += 1
+            file = util.render_file(scene, path.join(self.path, name))
+            util.imwrite(file, color, settings.file_format, colorspace='Non-Color')
+            z = np.where(disparity > 0, self.focal_base / np.maximum(disparity, 1e-12), 1e10)
+            util.imwrite(path.join(self.path, depth_file), np.repeat(z[..., None], 3, -1))
+            manifest.record(
+                self.path, name, path.basename(file),
+                time.perf_counter() - view_start, synth_hash, [depth_file],
+                synthesized=True, holes=round(float(holes.mean()), 6))
+            if self.packer:
+                self.packer.add(
+                    *self.poses.idx2pos(index), color[..., :self.channels])
+        self.finishing = False
+        self.report({'INFO'}, '{} key views, {synthesized} synthesized ({tiles} '
+                    'with rendered holes), {rendered} rendered in full, '
+                    'synthesis {:.1f} s'.format(
+                        len(self.keys), time.perf_counter() - start, **counts))
+
+    def denoise_hash(self, hash):
+        return f'{hash}/denoise{self.sample_fraction}:{self.noise_threshold}'
+
+    def refine(self, scene, index, name, border=None):
+        # render_view with all the samples of the scene
+        util.set_render_samples(scene, self.full_samples)
+        try:
+            return self.render_view(scene, index, name, border)
+        finally:
+            util.set_render_samples(scene, self.samples)
+
+    def denoise(self, context, neighbours=8):
+        # average every view with its nearest views, render the tiles that
+        # stay noisy again with all samples; the denoised files replace the
+        # noisy ones only at the end, the neighbours are read noisy
+        scene = context.scene
+        self.finishing = True
+        lf = self.camera.lightfield
+        self.focal_base = util.focal_px(scene, self.camera) * lf.base_x
+        ratio = lf.base_y / lf.base_x
+        uv = self.poses.uv
+        W, H = util.resolution(scene)
+        entries = manifest.load(self.path)
+        settings = scene.render.image_settings
+        counts = {'denoised': 0, 'patched': 0, 'rendered': 0, 'pixels': 0.0}
+        start = time.perf_counter()
+        sources = {}
+        finished = []
+        for index in range(len(self.poses)):
+            name = self.poses.name(index)
+            hash = self.denoise_hash(self.view_hash(scene, index))
+            if manifest.valid(entries.get(name), self.path, hash,
+                              self.pass_files(name)):
+                continue
+            view_start = time.perf_counter()
+            near = sorted(range(len(uv)), key=lambda k: np.hypot(
+                *(uv[k] - uv[index])))[:neighbours + 1]
+            sources = {k: sources.get(k) or self.source(scene, k) for k in near}
+            color, disparity, _ = sources[index]
+            color, noise = denoise.denoise(
+                color, disparity, [sources[k] for k in near if k != index],
+                uv[index], ratio)
+            file = util.render_file(scene, path.join(self.path, name))
+            rect = denoise.region(noise, self.noise_threshold, self.tile_size)
+            if rect is not None:
+                x0, y0, x1, y1 = rect
+                area = (x1 - x0) * (y1 - y0) / (W * H)
+            if rect is not None and area > self.max_patch:
+                self.refine(scene, index, name)
+                counts['rendered'] += 1
+                counts['pixels'] += 1
+                manifest.record(
+                    self.path, name, path.basename(file),
+                    time.perf_counter() - view_start, hash,
+                    self.pass_files(name), denoised=False)
+                if self.packer:
+                    self.packer.add(*self.poses.idx2pos(index),
+                                    util.imread(file)[..., :self.channels])
+                continue
+            if rect is not None:
+                fill = self.render_tile(scene, index, rect, self.refine)[0]
+                color[y0:y1, x0:x1] = fill[..., :color.shape[-1]]
+                counts['patched'] += 1
+                counts['pixels'] += area
+            temp = path.join(self.path, 'lf_denoised_' + path.basename(file))
+            util.imwrite(temp, color, settings.file_format, colorspace='Non-Color')
+            finished.append((index, name, file, temp,
+                             time.perf_counter() - view_start, hash))
+            counts['denoised'] += 1
+        for index, name, file, temp, elapsed, hash in finished:
+            os.replace(temp, file)
+            manifest.record(
+                self.path, name, path.basename(file), elapsed, hash,
+                self.pass_files(name), denoised=True)
+            if self.packer:
+                self.packer.add(*self.poses.idx2pos(index),
+                                util.imread(file)[..., :self.channels])
+        self.finishing = False
+        spent = self.sample_fraction + (1 - self.sample_fraction) * \
+            counts['pixels'] / max(1, counts['denoised'] + counts['rendered'])
+        self.report({'INFO'}, '{denoised} views denoised ({patched} with noisy '
+                    'tiles rendered again), {rendered} rendered again in full, '
+                    '{:.0%} of the full samples, denoising {:.1f} s'.format(
+                        spent, time.perf_counter() - start, **counts))
+
+    def plan_patches(self, scene, depsgraph, views):
+        # finished views that see objects changed since the last render are
+        # patched with the tiles of those objects or rendered again in full
+        old = fingerprint.load(self.path)
+        new = fingerprint.take(scene, depsgraph, self.exclude())
+        changes = fingerprint.changes(old, new) if old else None
+        todo = {i for _, i in self.todo}
+        self.changes = {'changed': [], 'views': len(views), 'skipped': 0,
+                        'patched': 0, 'full': len(todo), 'pixels': 0.0}
+        if changes is None:
+            print('no fingerprint of the last render or a global change, '
+                  'every view is rendered')
+            self.todo = [(None, i) for i in sorted(views, key=self.rank.get)]
+            self.changes['full'] = len(views)
+            return
+        names, boxes = changes
+        self.changes['changed'] = names
+        arrays, meta = self.calibration(scene)
+        W, H = meta['resolution']
+        tile = self.tile_size
+        near = self.camera.data.clip_start
+        for i in views:
+            if i in todo:
+                continue
+            rect = fingerprint.region(
+                boxes, arrays['poses'][i], arrays['intrinsics'][i], (W, H), near)
+            if rect is None:
+                self.changes['skipped'] += 1
+                continue
+            x0, y0, x1, y1 = rect
+            x0, y0 = x0 // tile * tile, y0 // tile * tile
+            x1, y1 = min(W, -(-x1 // tile) * tile), min(H, -(-y1 // tile) * tile)
+            if (x1 - x0) * (y1 - y0) > self.max_patch * W * H:
+                self.todo.append((None, i))
+                self.changes['full'] += 1
+            else:
+                self.patches.append((i, (x0, y0, x1, y1)))
+                self.changes['patched'] += 1
+                self.changes['pixels'] += (x1 - x0) * (y1 - y0) / (W * H)
+        self.todo.sort(key=lambda item: self.rank[item[1]])
+        self.patches.sort(key=lambda patch: self.rank[patch[0]])
+
+    def exclude(self):
+        # the camera plane follows the camera and is never rendered
+        lf = self.camera.lightfield
+        return {lf.plane.name} if lf.plane else set()
+
+    def patch(self, context):
+        # render the tiles of every patched view and copy them into its files
+        scene = context.scene
+        self.finishing = True
+        settings = scene.render.image_settings
+        for index, rect in self.patches:
+            start = time.perf_counter()
+            name = self.name(index)
+            x0, y0, x1, y1 = rect
+            print(f'patch {name} [{x0}:{x1}, {y0}:{y1}]')
+            tiles = self.render_tile(scene, index, rect)
+            file = self.view_file(scene, name)
+            targets = [(file, settings.file_format)]
+            targets += [(f, 'OPEN_EXR') for f in self.pass_files(name)]
+            for (target, format), tile in zip(targets, tiles):
+                target = path.join(self.path, target)
+                data = util.imread(target)
+                data[y0:y1, x0:x1] = tile[..., :data.shape[-1]]
+                util.imwrite(target, data, format, colorspace='Non-Color')
+            self.written(index, name, file, time.perf_counter() - start,
+                         self.view_hash(scene, index))
+        self.finishing = False
+
+    def finalize(self, context):
+        # steps that need every view of the render loop on disk
+        scene = context.scene
+        if self.sparse_step > 1:
+            self.synthesize(context)
+        if self.adaptive:
+            self.denoise(context)
+        if self.patches:
+            self.patch(context)
+        if self.incremental:
+            changes = self.changes
+            rendered = (changes['full'] + changes['pixels']) / max(1, changes['views'])
+            self.report({'INFO'}, '{} changed objects, views: {full} rendered, '
+                        '{patched} patched, {skipped} skipped, {:.1%} of the '
+                        'pixels rendered'.format(
+                            len(changes['changed']), rendered, **changes))
+        if self.reused:
+            # views of an unknown scene are on disk, the next incremental
+            # render has to render everything
+            fingerprint.discard(self.path)
+        else:
+            fingerprint.save(self.path, dict(
+                fingerprint.take(
+                    scene, context.evaluated_depsgraph_get(), self.exclude()),
+                views={self.poses.name(i): self.view_hash(scene, i)
+                       for i in range(len(self.poses))}))
+        self.finalized = True
 
     def init(self, context):
-        self.done = False
+        scene = context.scene
         self.rendering = False
-        self.poses = util.CamPoses(context.scene.camera)
+        self.window = None
+        self.finished = None
+        self.finishing = False
+        self.finalized = False
+        self.patches = []
+        self.camera = scene.camera
+        self.cameras = []
+        self.views = []
+        self.poses = util.CamPoses(scene.camera)
+        self.frame = None
+        self.frame_current = scene.frame_current
+        self.delta_location = Vector(self.camera.delta_location)
+        self.convergence = {}
+        if self.off_axis:
+            self.init_off_axis(scene)
+        self.frame_range = {}
+        if self.animation:
+            self.frame_range = {'frame_start': scene.frame_start,
+                                'frame_end': scene.frame_end,
+                                'frame_step': scene.frame_step}
+        self.filepath = scene.render.filepath
+        self.path = bpy.path.abspath(self.filepath)
+        self.passes = []
+        # the synthesis needs the depth of the keys, an adaptive render aligns
+        # the neighbours with theirs; the geometry option itself is left as
+        # the user set it
+        self.use_geometry = (
+            self.geometry or self.sparse_step > 1 or self.adaptive)
+        self.full_samples = util.render_samples(scene)
+        if self.adaptive:
+            util.set_render_samples(
+                scene, max(1, round(self.full_samples * self.sample_fraction)))
+        self.samples = util.render_samples(scene)
+        if self.use_geometry:
+            self.geo = util.init_geometry(
+                scene, self.path, self.sparse_step > 1 or self.adaptive)
+            self.passes = [t for t in ['depth', 'flow', 'normal']
+                           if getattr(scene.geo, t)]
+        self.packer = None
+        self.unpacked = []
+        # the channels of the written files, as pack.py reads them back
+        self.channels = {'BW': 1, 'RGB': 3}.get(
+            scene.render.image_settings.color_mode, 4)
+        if self.pack:
+            self.packer = pack.Packer(
+                self.path, self.poses.grid, self.params(),
+                compression=self.pack_compression or None)
+        views = util.shard_indices(
+            len(self.poses), self.shard, self.num_shards)
+        self.keys = set(layout.sparse(*self.poses.grid, self.sparse_step))
+        views = [i for i in views if i in self.keys]
+        # skip the views a previous run has finished with the same settings,
+        # every (frame, view) of an animation is tracked on its own
+        entries = manifest.load(self.path)
+        frames = self.frames(scene)
+        self.todo = []
+        self.frame_poses = {}
+        for frame in frames:
+            self.set_frame(scene, frame)
+            self.frame_poses[frame] = self.poses.matrices
+            for i in views:
+                name = self.name(i, frame)
+                hash = self.view_hash(scene, i)
+                if not manifest.valid(
+                        entries.get(name), self.path, hash,
+                        self.pass_files(name)) and not (
+                        self.adaptive and manifest.valid(
+                            entries.get(name), self.path,
+                            self.denoise_hash(hash), self.pass_files(name))):
+                    self.todo.append((frame, i))
+        self.rank = {i: r for r, i in enumerate(layout.ORDERS[self.view_order](
+            *self.poses.grid, self.poses.uv))}
+        if self.animation and self.order == 'VIEW':
+            self.todo.sort(key=lambda item: self.rank[item[1]])
+        else: # the frames keep their order
+            position = {frame: i for i, frame in enumerate(frames)}
+            self.todo.sort(
+                key=lambda item: (position[item[0]], self.rank[item[1]]))
+        if self.incremental:
+            self.plan_patches(scene, context.evaluated_depsgraph_get(), views)
+        if self.packer: # views an earlier run finished are only on disk
+            todo = {i for _, i in self.todo}
+            for i in range(len(self.poses)):
+                filepath = util.render_file(
+                    scene, path.join(self.path, self.name(i)))
+                if i not in todo and path.exists(filepath):
+                    self.unpacked.append((*self.poses.idx2pos(i), filepath))
+        # views taken from an earlier run without comparing its scene, an
+        # incremental render has checked every one of them
+        self.reused = 0 if self.incremental else \
+            len(views) * len(frames) - len(self.todo)
+        if len(self.todo) < len(views) * len(frames):
+            print(f'skip {len(views)*len(frames)-len(self.todo)} finished views')
         self.progress = 0
-        self.path = context.scene.render.filepath
+        self.done = not self.todo
+        self.metrics = metrics.Log(self.path)
+        self.gap = 0.0
+        self.use_persistent_data = scene.render.use_persistent_data
+        if self.persistent:
+            if scene.render.engine != 'CYCLES':
+                print(f'{scene.render.engine} does not keep render data, '
+                      'every view syncs the full scene')
+            scene.render.use_persistent_data = True
+        if self.block_size > 1:
+            self.init_multiview(scene)
+        if self.async_write:
+            self.init_writer(scene)
         bpy.app.handlers.render_init.append(self.pre)
+        bpy.app.handlers.render_stats.append(self.stats)
+        bpy.app.handlers.render_post.append(self.rendered)
         bpy.app.handlers.render_write.append(self.post)
+        bpy.app.handlers.render_complete.append(self.complete)
         bpy.app.handlers.render_cancel.append(self.clear)
+        bpy.app.handlers.depsgraph_update_post.append(self.update)
 
     def cancel(self, context):
         self.done = True
+        self.finalized = True
+        self.cancelled = True
+
+    def begin_preview(self, scene):
+        # the whole grid at a fraction of the resolution and samples first,
+        # a light field of its own under preview/
+        render = scene.render
+        self.previewing = True
+        self.preview_setup = (render.filepath, render.resolution_percentage,
+                              util.render_samples(scene))
+        render.filepath = path.join(render.filepath, 'preview', '')
+        render.resolution_percentage = max(
+            1, round(render.resolution_percentage * self.preview_scale))
+        util.set_render_samples(
+            scene, max(1, round(self.preview_setup[2] * self.preview_scale)))
+
+    def end_preview(self, scene):
+        render = scene.render
+        render.filepath, render.resolution_percentage = self.preview_setup[:2]
+        util.set_render_samples(scene, self.preview_setup[2])
+        self.previewing = False
 
     def clear(self, context):
-        context.scene.render.filepath = self.path
-        bpy.app.handlers.render_init.remove(self.pre)
-        bpy.app.handlers.render_write.remove(self.post)
-        bpy.app.handlers.render_cancel.remove(self.clear)
+        if self.block_size > 1:
+            self.clear_multiview(context.scene)
+        if self.use_geometry:
+            util.clear_geometry(context.scene, self.geo)
+        if self.off_axis:
+            self.clear_off_axis(context.scene)
+        try:
+            if self.async_write:
+                self.clear_writer(context.scene)
+                # param.txt only appears once every view is on disk
+                if self.shard == 0:
+                    self.write_meta(context)
+            if self.packer:
+                self.flush_pack()
+                self.packer.close()
+        finally: # a failed write must not leave the handlers behind
+            context.scene.render.filepath = self.filepath
+            context.scene.render.use_persistent_data = self.use_persistent_data
+            if self.adaptive:
+                util.set_render_samples(context.scene, self.full_samples)
+            bpy.app.handlers.render_init.remove(self.pre)
+            bpy.app.handlers.render_stats.remove(self.stats)
+            bpy.app.handlers.render_post.remove(self.rendered)
+            bpy.app.handlers.render_write.remove(self.post)
+            bpy.app.handlers.render_complete.remove(self.complete)
+            bpy.app.handlers.render_cancel.remove(self.clear)
+            bpy.app.handlers.depsgraph_update_post.remove(self.update)
 
-        context.scene.camera.location = self.poses.pos
+            if self.animation:
+                context.scene.frame_set(self.frame_current)
+                self.camera.delta_location = self.delta_location
+            else:
+                context.scene.camera.location = self.poses.pos
+        if self.metrics.entries:
+            summary = metrics.summary(
+                self.metrics.entries, len(self.todo) - self.progress)
+            with open(path.join(self.path, 'metrics.json'), 'w') as f:
+                json.dump(summary, f, indent=2)
+            for line in metrics.report(summary).split('\n'):
+                self.report({'INFO'}, line)
+
+    def invalid(self, context):
+        scene = context.scene
+        if self.geometry and self.block_size > 1:
+            return 'geometry passes can not be written from multiview blocks'
+        if self.async_write and self.block_size > 1:
+            return 'multiview blocks can not be written in the background'
+        if self.sparse_step > 1 and (
+                self.block_size > 1 or self.async_write or self.num_shards > 1):
+            return ('sparse renders synthesize from the key views on disk, '
+                    'render them without blocks, background writes or shards')
+        if self.pack and self.num_shards > 1:
+            return ('shards can not stream into the same packed array, pack '
+                    'the finished light field with pack.py instead')
+        if self.animation and (self.sparse_step > 1 or self.pack):
+            return 'animations can not be rendered sparse or packed'
+        if self.incremental and (self.animation or self.sparse_step > 1
+                                 or self.block_size > 1):
+            return ('incremental renders patch single still views, render '
+                    'them without animation, sparse views or blocks')
+        if self.adaptive and (
+                self.sparse_step > 1 or self.block_size > 1 or self.async_write
+                or self.num_shards > 1 or self.animation or self.incremental):
+            return ('adaptive renders denoise with the neighbouring views on '
+                    'disk, render them without sparse views, blocks, '
+                    'background writes, shards, animation or incremental '
+                    'updates')
+        if self.off_axis and self.sparse_step > 1:
+            return 'off-axis views can not be synthesized from sparse views'
+        if self.off_axis and scene.camera.data.type != 'PERSP':
+            return 'off-axis rendering needs a perspective camera'
+        if self.off_axis and self.crop:
+            x0, y0, x1, y1 = self.shifts(
+                scene, util.CamPoses(scene.camera))[2]
+            if x1 <= x0 or y1 <= y0:
+                return 'the views share no pixels, move the focus further away'
+        if self.async_write and bpy.app.background:
+            return ('background writes read the viewer node, which blender '
+                    'does not run without a window (-b), use write_still')
+        if self.async_write and scene.node_tree:
+            nodes = scene.node_tree.nodes
+            composite = next((n for n in nodes if n.type == 'COMPOSITE'), None)
+            if composite is None:
+                return 'background writes need a composite node'
+            if not composite.inputs['Image'].links and not any(
+                    n.type == 'R_LAYERS' for n in nodes):
+                return 'the composite node of a background write has no input'
+        if (self.async_write
+                and scene.render.image_settings.file_format != 'OPEN_EXR'
+                and scene.view_settings.view_transform != 'Standard'):
+            return ('background writes of display images need the Standard '
+                    'view transform, or write OPEN_EXR')
+        return None
 
     def invoke(self, context, event):
+        # the active camera is the one rendered, and the one checked
+        obj = context.object
+        if obj and obj.type == 'CAMERA' and obj.lightfield.enabled:
+            context.scene.camera = obj
+        error = self.invalid(context)
+        if error:
+            self.report({'ERROR'}, error)
+            return {'CANCELLED'}
         context.window_manager.modal_handler_add(self)
         self.timer = context.window_manager.event_timer_add(
             0.5, window=context.window)
-        if context.object.type == 'CAMERA' and context.object.lightfield.enabled:
-            context.scene.camera = context.object
-        self.init(context)
-        self.write_meta(context)
+        self.previewing = self.cancelled = False
+        if self.progressive:
+            self.begin_preview(context.scene)
+        self.launch(context)
         return {'RUNNING_MODAL'}
 
+    def launch(self, context):
+        self.init(context)
+        if self.shard == 0 and not self.async_write:
+            self.write_meta(context)
+        # every following view is started by the render_complete handler
+        self.window = context.window
+        self.retries = 0
+        if not self.done:
+            bpy.app.timers.register(self.chain, first_interval=0)
+
     def modal(self, context, event):
+        if self.done and not self.finalized:
+            # the render job of the last key view has to close first
+            if getattr(bpy.app, 'is_job_running', lambda job: False)('RENDER'):
+                return {'PASS_THROUGH'}
+            self.finalize(context)
         if self.done:
+            self.clear(context)
+            if self.previewing:
+                self.end_preview(context.scene)
+                if not self.cancelled:
+                    self.launch(context)
+                    return {'PASS_THROUGH'}
             context.window_manager.event_timer_remove(self.timer)
             self.timer = None
-            self.clear(context)
             return {'FINISHED'}
-        if event.type == 'TIMER':
-            if not self.rendering:
-                bpy.ops.render.render(
-                    "INVOKE_DEFAULT",
-                    write_still=True)
-        elif event.type == 'ESC':
+        if event.type == 'ESC':
             self.cancel(context)
 
         return {'PASS_THROUGH'}
 
     def execute(self, context):
+        error = self.invalid(context)
+        if error:
+            self.report({'ERROR'}, error)
+            return {'CANCELLED'}
+        self.previewing = self.cancelled = False
+        if self.progressive:
+            self.begin_preview(context.scene)
+            try:
+                self.run(context)
+            finally:
+                self.end_preview(context.scene)
+        self.run(context)
+        return {'FINISHED'}
+
+    def run(self, context):
+        # one blocking pass over every view, a failed one leaves no handlers
+        # or settings behind for the next job of a batch
         self.init(context)
-        self.write_meta(context)
-        while not self.done:
+        try:
+            if self.shard == 0 and not self.async_write:
+                self.write_meta(context)
+            while not self.done:
+                self.next(context.scene)
+                bpy.ops.render.render(write_still=not self.async_write)
+                if self.async_write:
+                    self.grab(context.scene)
+            if not self.finalized:
+                self.finalize(context)
+        finally:
+            self.clear(context)
+
+
+class EstimateLightField(bpy.types.Operator):
+    bl_idname = "render.lightfield_estimate"
+    bl_label = "estimate light field render"
+
+    views: bpy.props.IntProperty(
+        default=5, min=1,
+        description='number of sample views, spread over the camera plane')
+    scales: bpy.props.FloatVectorProperty(
+        size=2, default=(0.25, 0.5), min=0.01, max=1,
+        description='fractions of the resolution and samples of the two '
+                    'rounds of sample renders')
+    deadline: bpy.props.FloatProperty(
+        default=0, min=0,
+        description='hours the full render may take, for the suggested '
+                    'number of shards')
+    # the options of render.lightfield that change its cost
+    geometry: bpy.props.BoolProperty(default=False)
+    sparse_step: bpy.props.IntProperty(default=1, min=1)
+    adaptive: bpy.props.BoolProperty(default=False)
+    sample_fraction: bpy.props.FloatProperty(default=0.25, min=0.01, max=1)
+    progressive: bpy.props.BoolProperty(default=False)
+    preview_scale: bpy.props.FloatProperty(default=0.25, min=0.01, max=1)
+
+    def sample_rss(self, *args):
+        # render_stats fires all through a render, unlike the peak rss the
+        # current one goes down again between the sample renders
+        rss = metrics.current_rss()
+        if rss:
+            self.rss = max(self.rss or 0, rss)
+
+    def measure(self, scene, cam, poses, index, dirpath):
+        render = scene.render
+        cam.location = poses[index]
+        render.filepath = path.join(dirpath, poses.name(index))
+        self.rss = metrics.current_rss()
+        bpy.app.handlers.render_stats.append(self.sample_rss)
+        start = time.perf_counter()
+        try:
             bpy.ops.render.render(write_still=True)
-        self.clear(context)
+        finally:
+            bpy.app.handlers.render_stats.remove(self.sample_rss)
+        seconds = time.perf_counter() - start
+        w, h = util.resolution(scene)
+        # the colour file and every pass the compositor wrote
+        files = [path.join(dirpath, f) for f in os.listdir(dirpath)]
+        measurement = {
+            'view': poses.name(index),
+            'pixels': w * h,
+            'samples': util.render_samples(scene),
+            'seconds': seconds,
+            'bytes': sum(path.getsize(f) for f in files),
+            'rss': self.rss}
+        for file in files:
+            os.remove(file)
+        return measurement
 
-        return {'FINISHED'}
+    def execute(self, context):
+        scene = context.scene
+        render = scene.render
+        cam = scene.camera
+        poses = util.CamPoses(cam)
+        output = bpy.path.abspath(render.filepath)
+        W, H = util.resolution(scene)
+        samples = util.render_samples(scene)
+        setup = (render.filepath, render.resolution_percentage)
+        indices = layout.spread(poses.uv, self.views)
+        dirpath = tempfile.mkdtemp()
+        measurements = []
+        # the passes of the render, sparse and adaptive renders add depth
+        depth = self.sparse_step > 1 or self.adaptive
+        geo = util.init_geometry(scene, dirpath, depth) \
+            if self.geometry or depth else None
+        try:
+            for k, scale in enumerate(sorted(self.scales)):
+                render.resolution_percentage = max(1, round(setup[1] * scale))
+                util.set_render_samples(scene, max(1, round(samples * scale)))
+                if k == 0: # the first render compiles kernels and loads images
+                    self.measure(scene, cam, poses, indices[0], dirpath)
+                for index in indices:
+                    measurements.append(
+                        self.measure(scene, cam, poses, index, dirpath))
+        finally:
+            render.filepath, render.resolution_percentage = setup
+            util.set_render_samples(scene, samples)
+            cam.location = poses.pos
+            if geo:
+                util.clear_geometry(scene, geo)
+            shutil.rmtree(dirpath, ignore_errors=True)
 
+        # sparse renders only render the key views, adaptive ones at a
+        # fraction of the samples; synthesis and refined tiles are not counted
+        rendered = len(poses)
+        if self.sparse_step > 1:
+            rendered = len(layout.sparse(*poses.grid, self.sparse_step))
+        full = max(1, round(samples * self.sample_fraction)) \
+            if self.adaptive else samples
+        result = estimate.project(
+            measurements, W * H, full, rendered, len(poses))
+        if self.progressive:
+            w, h = (max(1, round(x * self.preview_scale)) for x in (W, H))
+            preview = estimate.project(
+                measurements, w * h, max(1, round(full * self.preview_scale)),
+                rendered, len(poses))
+            result['preview'] = {key: preview[key]
+                                 for key in ['total_seconds', 'total_bytes']}
+            result['total_seconds'] += preview['total_seconds']
+            result['total_bytes'] += preview['total_bytes']
+        # the high-water mark of the process, the sample renders included
+        result['peak_rss'] = metrics.peak_rss()
+        result['shards'] = estimate.shards(
+            result['total_seconds'], self.deadline * 3600,
+            result['peak_memory'], estimate.available_memory())
+        result['measurements'] = measurements
+        os.makedirs(output, exist_ok=True)
+        with open(path.join(output, 'estimate.json'), 'w') as f:
+            json.dump(result, f, indent=2)
+        self.report({'INFO'}, '{} views: {:.0f} s ({:.1f}-{:.1f} s per view), '
+                    '{:.1f} MiB'.format(
+                        len(poses), result['total_seconds'],
+                        result['seconds_per_view_min'],
+                        result['seconds_per_view_max'],
+                        result['total_bytes'] / 2**20))
+        if result['shards']['for_deadline']:
+            self.report({'INFO'}, '{for_deadline} shards for the deadline, '
+                        '{fit_in_memory} fit into memory'.format(
+                            **result['shards']))
+        return {'FINISHED'}
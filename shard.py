@@ -0,0 +1,176 @@
+"""Render a light field with several background blender processes.
+
+    python shard.py scene.blend -j 2 --camera Camera --output /tmp/lf/
+
+Each worker runs ``blender -b`` on the same file and renders every
+``num_shards``-th view of the camera grid into the usual ``{s:02}_{t:02}``
+layout. Progress and failures of all workers are gathered here.
+"""
+import argparse
+import json
+import os
+import os.path as path
+import re
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+PACKAGE = path.basename(path.dirname(path.abspath(__file__)))
+PROGRESS = re.compile(r'render on (\d+)/(\d+)')
+TAG = 'lightfield: '
+
+
+def worker_cmd(args, shard):
+    # the cores are split between the workers, not rendered on by each
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.jobs)
+    cmd = [args.blender, '-b', args.blend, '-t', str(threads),
+           '--python-exit-code', '1',
+           '--python', path.abspath(__file__), '--',
+           '--worker', '--shard', str(shard), '-j', str(args.jobs)]
+    if args.camera:
+        cmd += ['--camera', args.camera]
+    if args.output:
+        cmd += ['--output', args.output]
+    return cmd
+
+
+class Worker(object):
+    def __init__(self, shard, cmd, log):
+        self.shard = shard
+        self.progress = 0
+        self.total = 0
+        self.info = {}
+        self.lines = []
+        self.log = log
+        self.proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            universal_newlines=True)
+        self.thread = threading.Thread(target=self.read, daemon=True)
+        self.thread.start()
+
+    def read(self):
+        with open(self.log, 'w') as log:
+            for line in self.proc.stdout:
+                log.write(line)
+                self.lines = (self.lines + [line.rstrip()])[-20:]
+                if line.startswith(TAG):
+                    self.info = json.loads(line[len(TAG):])
+                    self.total = len(self.info['views'])
+                m = PROGRESS.search(line)
+                if m:
+                    self.progress = int(m.group(1))
+
+    def wait(self):
+        code = self.proc.wait()
+        self.thread.join()
+        if code == 0:
+            self.progress = self.total
+        return code
+
+    def missing(self):
+        # views without a manifest entry of the worker's settings whose
+        # files, passes included, are all on disk; imported here as blender
+        # runs the workers without this directory on sys.path
+        if __package__:
+            from . import manifest
+        else: # run as a script
+            import manifest
+        output = self.info.get('output')
+        if output is None:
+            return []
+        entries = manifest.load(output)
+        return [name for name, hash in self.info['views'].items()
+                if not manifest.valid(entries.get(name), output, hash)]
+
+
+def drive(args):
+    logdir = args.logs or path.join(args.output or '.', 'logs')
+    os.makedirs(logdir, exist_ok=True)
+    workers = [
+        Worker(i, worker_cmd(args, i), path.join(logdir, f'shard{i:02}.log'))
+        for i in range(args.jobs)]
+    start = time.time()
+    while any(w.proc.poll() is None for w in workers):
+        done = sum(w.progress for w in workers)
+        total = sum(w.total for w in workers)
+        print(f'\r{done:4d}/{total:4d} views, {time.time()-start:7.1f}s',
+              end='', flush=True)
+        time.sleep(1)
+    print()
+
+    failed = []
+    for w in workers:
+        code = w.wait()
+        missing = w.missing()
+        if code != 0 or missing:
+            failed.append(w)
+            print(f'shard {w.shard} failed (exit code {code}), '
+                  f'missing views: {" ".join(missing) or "-"}')
+            print('\n'.join('    ' + l for l in w.lines))
+    print(f'{args.jobs - len(failed)}/{args.jobs} shards finished '
+          f'in {time.time()-start:.1f}s, logs in {logdir}')
+    return 1 if failed else 0
+
+
+def work(args):
+    import addon_utils
+    import bpy
+    sys.path.insert(0, ROOT)
+    addon_utils.enable(PACKAGE, default_set=False)
+    from importlib import import_module
+    util = import_module(f'{PACKAGE}.util')
+    manifest = import_module(f'{PACKAGE}.manifest')
+
+    scene = bpy.context.scene
+    if args.camera:
+        scene.camera = bpy.data.objects[args.camera]
+    if args.output:
+        scene.render.filepath = args.output
+    scene.render.filepath = bpy.path.abspath(scene.render.filepath)
+    poses = util.CamPoses(scene.camera)
+    rotation = scene.camera.matrix_world.to_3x3()
+    # the hash every view is recorded with, like RenderLightField.view_hash
+    views = {
+        poses.name(i): manifest.settings_hash(scene, poses[i], rotation)
+        for i in util.shard_indices(len(poses), args.shard, args.jobs)}
+    print(TAG + json.dumps({
+        'shard': args.shard,
+        'output': scene.render.filepath,
+        'views': views}), flush=True)
+    bpy.ops.render.lightfield(shard=args.shard, num_shards=args.jobs)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('blend', nargs='?', help='the .blend file to render')
+    parser.add_argument('-j', '--jobs', type=int, default=2,
+                        help='number of blender processes, each holds a '
+                             'copy of the scene in memory')
+    parser.add_argument('-t', '--threads', type=int, default=0,
+                        help='render threads of every worker, the cores '
+                             'divided by the workers by default')
+    parser.add_argument('--blender', default='blender',
+                        help='path to the blender executable')
+    parser.add_argument('--camera', default='',
+                        help='light field camera, the scene camera by default')
+    parser.add_argument('--output', default='',
+                        help='output directory, scene.render.filepath by default')
+    parser.add_argument('--logs', default='',
+                        help='directory for the worker logs')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--shard', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.worker:
+        return work(args)
+    if not args.blend:
+        parser.error('a .blend file is required')
+    if args.output:
+        args.output = path.join(path.abspath(args.output), '')
+    return drive(args)
+
+
+if __name__ == '__main__':
+    argv = sys.argv[sys.argv.index('--')+1:] if '--' in sys.argv else sys.argv[1:]
+    sys.exit(main(argv))
@@ -0,0 +1,80 @@
+"""Depth-image-based synthesis of light field views.
+
+Views are forward-warped from their neighbours with the disparity of the
+source, in pixels per base_x like refocus.py: a point moves by du * d along x
+and by -dv * d * base_y / base_x along the (bottom-up) rows. Where several
+sources land on the same pixel the nearest surface wins; pixels no source
+covers are reported as holes.
+"""
+import numpy as np
+
+
+def warp(color, disparity, du, dv, ratio=1.0):
+    """forward warp one source view, returns colour, disparity and coverage"""
+    H, W = disparity.shape
+    ys, xs = np.mgrid[0:H, 0:W]
+    xt = np.rint(xs + du * disparity).astype(np.int64)
+    yt = np.rint(ys - dv * disparity * ratio).astype(np.int64)
+    inside = (xt >= 0) & (xt < W) & (yt >= 0) & (yt < H)
+    target = (yt * W + xt)[inside]
+    d = disparity[inside]
+    # numpy keeps the last of repeated indices, so write far to near
+    order = np.argsort(d, kind='stable')
+    out_color = np.zeros((H * W, color.shape[-1]), dtype=np.float32)
+    out_disp = np.full(H * W, -np.inf, dtype=np.float32)
+    out_color[target[order]] = color[inside][order]
+    out_disp[target[order]] = d[order]
+    covered = np.isfinite(out_disp)
+    return (out_color.reshape(H, W, -1), out_disp.reshape(H, W),
+            covered.reshape(H, W))
+
+
+def fill_cracks(color, disparity, covered):
+    # one pixel cracks of the rounding, filled from covered neighbours
+    H, W = covered.shape
+    pad = lambda a: np.pad(a, ((1, 1), (1, 1)) + ((0, 0),) * (a.ndim - 2))
+    c, d, m = pad(color), pad(np.where(covered, disparity, 0)), pad(covered)
+    count = np.zeros((H, W), np.float32)
+    acc_c = np.zeros_like(color)
+    acc_d = np.zeros((H, W), np.float32)
+    for dy in (0, 1, 2):
+        for dx in (0, 1, 2):
+            if dy == dx == 1:
+                continue
+            w = m[dy:dy+H, dx:dx+W]
+            count += w
+            acc_c += c[dy:dy+H, dx:dx+W] * w[..., None]
+            acc_d += d[dy:dy+H, dx:dx+W] * w
+    crack = ~covered & (count >= 5)
+    color[crack] = acc_c[crack] / count[crack, None]
+    disparity[crack] = acc_d[crack] / count[crack]
+    return covered | crack
+
+
+def synthesize(sources, uv, ratio=1.0, tolerance=0.5):
+    """blend warps of (color, disparity, uv) sources into the view at uv,
+    returns colour, disparity and the mask of holes"""
+    warps = []
+    for color, disparity, src in sources:
+        du, dv = uv[0] - src[0], uv[1] - src[1]
+        w = 1.0 / (np.hypot(du, dv) + 1e-6)
+        warps.append(warp(color, disparity, du, dv, ratio) + (w,))
+    front = np.max([d for _, d, _, _ in warps], axis=0)
+    H, W = front.shape
+    color = np.zeros((H, W, warps[0][0].shape[-1]), dtype=np.float32)
+    weight = np.zeros((H, W), dtype=np.float32)
+    # average the sources that see the front-most surface
+    for c, d, covered, w in warps:
+        keep = covered & (d >= front - tolerance)
+        color += c * (w * keep)[..., None]
+        weight += w * keep
+    covered = weight > 0
+    color[covered] /= weight[covered, None]
+    disparity = np.where(covered, front, 0).astype(np.float32)
+    covered = fill_cracks(color, disparity, covered)
+    return color, disparity, ~covered
+
+
+def psnr(a, b, peak=1.0):
+    mse = float(np.mean((np.asarray(a, np.float64) - b) ** 2))
+    return float('inf') if mse == 0 else 10 * np.log10(peak**2 / mse)
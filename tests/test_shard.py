@@ -0,0 +1,89 @@
+"""Sharded renders, on the CPU and a tiny scene.
+
+    BLENDER=/path/to/blender python -m pytest tests
+
+The render itself is skipped where no blender is found, the check of the
+finished views runs without it.
+"""
+import os
+import os.path as path
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ADDON = path.dirname(path.dirname(path.abspath(__file__)))
+ROOT, PACKAGE = path.split(ADDON)
+BLENDER = os.environ.get('BLENDER') or shutil.which('blender')
+sys.path.insert(0, ADDON)
+
+import manifest
+import shard
+
+SCENE = """
+import sys, bpy, addon_utils
+bpy.ops.wm.read_factory_settings(use_empty=True)
+sys.path.insert(0, {root!r})
+addon_utils.enable({package!r}, default_set=False)
+scene = bpy.context.scene
+bpy.ops.mesh.primitive_cube_add()
+light = bpy.data.objects.new('Light', bpy.data.lights.new('Light', 'SUN'))
+scene.collection.objects.link(light)
+cam = bpy.data.objects.new('Camera', bpy.data.cameras.new('Camera'))
+scene.collection.objects.link(cam)
+cam.location = (0, -6, 0)
+cam.rotation_euler = (1.5708, 0, 0)
+scene.camera = cam
+bpy.context.view_layer.objects.active = cam
+lf = cam.lightfield
+lf.enabled = True
+lf.num_rows = lf.num_cols = 2
+render = scene.render
+render.engine = 'CYCLES'
+scene.cycles.device = 'CPU'
+scene.cycles.samples = 1
+render.resolution_x, render.resolution_y = 32, 24
+render.resolution_percentage = 100
+render.image_settings.file_format = 'PNG'
+bpy.ops.wm.save_as_mainfile(filepath={blend!r})
+"""
+
+
+def worker(output, views):
+    w = object.__new__(shard.Worker) # without a process
+    w.info = {'output': str(output), 'views': views}
+    return w
+
+
+def test_missing_checks_files_and_passes(tmp_path):
+    (tmp_path / '0001').mkdir()
+    for file in ['0001/00_00.png', '0001/00_00_depth.exr', '00_01.png',
+                 '00_01_depth.exr']:
+        (tmp_path / file).write_bytes(b'view')
+    manifest.record(str(tmp_path), '00_00', '0001/00_00.png', 1.0, 'a',
+                    ['0001/00_00_depth.exr'])
+    manifest.record(str(tmp_path), '00_01', '00_01.png', 1.0, 'b',
+                    ['00_01_depth.exr'])
+    manifest.record(str(tmp_path), '01_00', '00_01.png', 1.0, 'old')
+    (tmp_path / '00_01_depth.exr').unlink()
+    missing = worker(tmp_path, {
+        '00_00': 'a', '00_01': 'b', '01_00': 'c', '01_01': 'd'}).missing()
+    # the pass of 00_01 is gone, 01_00 has other settings, 01_01 no entry
+    assert missing == ['00_01', '01_00', '01_01']
+
+
+@pytest.mark.skipif(not BLENDER, reason='blender not found')
+def test_two_shards_render_every_view(tmp_path):
+    blend = str(tmp_path / 'scene.blend')
+    subprocess.run(
+        [BLENDER, '-b', '--factory-startup', '--python-expr',
+         SCENE.format(root=ROOT, package=PACKAGE, blend=blend)], check=True)
+    output = tmp_path / 'lf'
+    code = shard.main([blend, '-j', '2', '--blender', BLENDER,
+                       '--output', str(output)])
+    assert code == 0
+    entries = manifest.load(str(output))
+    assert sorted(entries) == ['00_00', '00_01', '01_00', '01_01']
+    for entry in entries.values():
+        assert path.exists(path.join(output, entry['file']))
@@ -0,0 +1,33 @@
+"""Enabling the addon in a fresh headless blender stays cheap.
+
+    BLENDER=/path/to/blender python -m pytest tests
+
+Runs bench.py startup, which enables the addon in a new blender -b, and is
+skipped where no blender is found. Enabling has to stay within
+STARTUP_BUDGET seconds, 0.5 by default; the best of three runs counts.
+"""
+import json
+import os
+import os.path as path
+import shutil
+import subprocess
+
+import pytest
+
+ADDON = path.dirname(path.dirname(path.abspath(__file__)))
+BLENDER = os.environ.get('BLENDER') or shutil.which('blender')
+BUDGET = float(os.environ.get('STARTUP_BUDGET', 0.5))
+
+
+@pytest.mark.skipif(not BLENDER, reason='blender not found')
+def test_startup_does_not_import_numpy(tmp_path):
+    output = tmp_path / 'startup.json'
+    subprocess.run(
+        [BLENDER, '-b', '--factory-startup', '--python',
+         path.join(ADDON, 'bench.py'), '--', 'startup', '--output', str(output)],
+        check=True)
+    result = json.loads(output.read_text())['startup']
+    assert not result['numpy'], 'numpy is imported when the addon is enabled'
+    assert result['modules'] > 0
+    assert result['enable'] <= BUDGET, \
+        f"enabling the addon took {result['enable']:.3f}s, over {BUDGET}s"
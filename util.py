@@ -1,31 +1,137 @@
 import bpy
 import bmesh
+import importlib.util
+import sys
 from mathutils import Vector
-import numpy as np
 
-def imread(path):
-    image = bpy.data.images.load(path, check_existing=False)
+def lazy(name, package=__package__):
+    # module imported on its first attribute access, so enabling the addon
+    # does not pay for numpy until an operator needs it
+    name = importlib.util.resolve_name(name, package)
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+np = lazy('numpy')
+layout = lazy('.layout')
+
+def pixels(image, channels=None, out=None):
+    # copy the pixels of a blender image straight into a float32 buffer
     w, h = image.size
     c = image.channels
-    arr = np.array(image.pixels[:]).reshape((h, w, c))
-    bpy.data.images.remove(image)
-    return arr
+    if out is None:
+        out = np.empty((h, w, c), dtype=np.float32)
+    image.pixels.foreach_get(out.reshape(-1))
+    if channels is not None:
+        return np.ascontiguousarray(out[..., channels])
+    return out
 
-def imwrite(path, data, mode='OPEN_EXR'):
+def imread(path, channels=None, out=None):
+    image = bpy.data.images.load(path, check_existing=False)
+    try:
+        return pixels(image, channels, out)
+    finally:
+        bpy.data.images.remove(image)
+
+def imwrite(path, data, mode='OPEN_EXR', colorspace=None):
+    # colorspace 'Non-Color' writes the values as they are, like imread
+    # returns them, instead of converting them from scene linear
     images = bpy.data.images
     H, W, C = data.shape
-    assert C == 4
+    assert C in (1, 3, 4)
+    if C < 4: # opaque alpha, grey for a single channel
+        data = np.concatenate(
+            [data] * (3 if C == 1 else 1) + [np.ones((H, W, 4-max(C, 3)))], -1)
     image = images.new(
         name='imwrite', width=W, height=H,
         float_buffer=True, alpha=False)
-    image.pixels[:] = data.ravel()
+    if colorspace:
+        image.colorspace_settings.name = colorspace
+    image.pixels.foreach_set(
+        np.ascontiguousarray(data, dtype=np.float32).reshape(-1))
     if mode == 'OPEN_EXR' and not path.endswith('.exr'):
         path += '.exr'
     image.filepath = path
     image.file_format = mode
     image.save()
-    images.remove(images['imwrite'])
+    images.remove(image)
+
+
+def resolution(scene):
+    render = scene.render
+    scale = render.resolution_percentage
+    return (render.resolution_x * scale // 100,
+            render.resolution_y * scale // 100)
+
+def sensor_fit(scene, cam):
+    # pixels and millimetres of the image side the lens and shift refer to
+    w, h = resolution(scene)
+    data = cam.data
+    if data.sensor_fit == 'VERTICAL':
+        return h, data.sensor_height
+    if data.sensor_fit == 'HORIZONTAL':
+        return w, data.sensor_width
+    return max(w, h), data.sensor_width
+
+def focal_px(scene, cam):
+    # focal length in pixels, following blender's sensor fit
+    pixels, sensor = sensor_fit(scene, cam)
+    return cam.data.lens * pixels / sensor
+
+def render_samples(scene):
+    if scene.render.engine == 'CYCLES':
+        return scene.cycles.samples
+    return scene.eevee.taa_render_samples
+
+def set_render_samples(scene, samples):
+    if scene.render.engine == 'CYCLES':
+        scene.cycles.samples = samples
+    else:
+        scene.eevee.taa_render_samples = samples
 
+GEO = ['enabled', 'depth', 'normal', 'flow', 'base_path']
+
+def init_geometry(scene, dirpath, depth=False):
+    # write the passes of the geometry panel into dirpath, depth at least
+    # when asked for or none is on; returns what clear_geometry restores
+    geo = scene.geo
+    setup = {type: getattr(geo, type) for type in GEO}
+    if not geo.enabled: # enabling twice would add the nodes twice
+        geo.enabled = True
+    if depth or not (geo.depth or geo.normal or geo.flow):
+        geo.depth = True
+    geo.base_path = dirpath
+    return setup
+
+def clear_geometry(scene, setup):
+    geo = scene.geo
+    for type in reversed(GEO): # the nodes go away with enabled, last
+        if getattr(geo, type) != setup[type]:
+            setattr(geo, type, setup[type])
+
+def display(scene, data):
+    # the Standard view transform on scene linear pixels, exposure, gamma
+    # and the sRGB transfer function, alpha is kept as it is
+    view = scene.view_settings
+    rgb = data[..., :3] * 2.0 ** view.exposure
+    rgb = np.clip(rgb, 0, None) ** (1 / view.gamma)
+    rgb = np.where(rgb <= 0.0031308, 12.92 * rgb,
+                   1.055 * rgb ** (1 / 2.4) - 0.055)
+    return np.concatenate([rgb, data[..., 3:]], axis=-1).astype(np.float32)
+
+def render_file(scene, filepath):
+    # the file blender writes for a still rendered to filepath
+    if scene.render.use_file_extension:
+        filepath += scene.render.file_extension
+    return bpy.path.abspath(filepath)
 
 def create_plane(context, size=1):
     x = size / 2
@@ -37,32 +143,51 @@ def create_plane(context, size=1):
     context.scene.collection.objects.link(object)
     return object
 
+def shard_indices(n, shard=0, num_shards=1):
+    # interleave the views so every shard gets a similar spread of the grid
+    return list(range(shard, n, num_shards))
+
 class CamPoses(object):
-    def __init__(self, cam):
+    """all camera positions and world matrices of a light field camera
+
+    positions is an (N, 3) and matrices an (N, 4, 4) array in view order,
+    computed once for the layout of the camera or for the given (N, 2)
+    plane coordinates."""
+    def __init__(self, cam, points=None):
         self.pos = Vector(cam.location)
         lf = cam.lightfield
         self.grid = (lf.num_rows, lf.num_cols)
         dir = cam.matrix_world.to_3x3().normalized()
         self.dx = dir @ Vector((-1., 0., 0.)) * lf.base_x
         self.dy = dir @ Vector((0., 1., 0.)) * lf.base_y
+        if points is None and lf.layout == 'POINTS':
+            points = [v.co for v in lf.points.data.vertices] if lf.points else [(0, 0)]
+        if points is None:
+            self.uv = layout.LAYOUTS[lf.layout](*self.grid)
+        else:
+            self.uv = layout.points(points)
+            self.grid = (1, len(self.uv))
+        self.offsets = self.uv @ np.array([self.dx, self.dy])
+        self.positions = np.array(self.pos) + self.offsets
+        self.matrices = np.repeat(np.array(cam.matrix_world)[None], len(self), 0)
+        self.matrices[:, :3, 3] += self.offsets
 
     def __len__(self):
         return self.grid[0] * self.grid[1]
 
     def __getitem__(self, index):
-        S, T = self.grid
-        if isinstance(index, int):
-            s, t = self.idx2pos(index)
-        else:
-            s, t = index
-        dx = self.dx * (2*t/(T-1)-1) if T > 1 else Vector((0,0,0))
-        dy = self.dy * (2*s/(S-1)-1) if S > 1 else Vector((0,0,0))
-        return self.pos + dx + dy
+        if not isinstance(index, (int, np.integer)):
+            index = self.pos2idx(*index)
+        return Vector(self.positions[index])
 
     def bound(self, s, t):
         S, T = self.grid
         return (max(0, min(s, S-1)), max(0, min(t, T-1)))
 
+    def name(self, index):
+        s, t = self.idx2pos(index)
+        return f'{s:02}_{t:02}'
+
     def pos2idx(self, s, t):
         T = self.grid[1]
         return s*T+t
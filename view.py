@@ -1,5 +1,8 @@
 import bpy
-from .util import CamPoses
+import os.path as path
+from collections import OrderedDict
+from .util import CamPoses, render_file, lazy
+pack = lazy('.pack')
 
 def register():
     bpy.utils.register_class(PreviewLightField)
@@ -16,10 +19,66 @@ def add_preview_lightfield(self, context):
         icon='VIEW3D')
     bpy.types.VIEW3D_MT_view_viewpoint.remove(add_preview_lightfield)
 
+class ViewCache(object):
+    # decoded views as blender images and gpu textures, least recently used
+    # views are dropped once there are more than capacity
+    def __init__(self, files, capacity=16):
+        self.files = files
+        self.capacity = capacity
+        self.items = OrderedDict()
+
+    def __contains__(self, pos):
+        return pos in self.items
+
+    def get(self, pos):
+        if pos in self.items:
+            self.items.move_to_end(pos)
+            return self.items[pos][1]
+        if pos not in self.files:
+            return None
+        import gpu
+        image = bpy.data.images.load(self.files[pos], check_existing=False)
+        self.items[pos] = (image, gpu.texture.from_image(image))
+        while len(self.items) > self.capacity:
+            _, (old, _) = self.items.popitem(last=False)
+            bpy.data.images.remove(old)
+        return self.items[pos][1]
+
+    def clear(self):
+        for image, _ in self.items.values():
+            bpy.data.images.remove(image)
+        self.items.clear()
+
+
+def rendered_views(scene, camera, poses):
+    # the files of an existing light field render of this camera, the views
+    # of a progressive render's preview where the full ones are still missing
+    root = bpy.path.abspath(scene.render.filepath)
+    files = {}
+    for dirpath in [path.join(root, 'preview'), root]:
+        if pack.read_params(dirpath).get('cmera') != camera.name:
+            continue
+        for index in range(len(poses)):
+            filepath = render_file(scene, path.join(dirpath, poses.name(index)))
+            if path.exists(filepath):
+                files[poses.idx2pos(index)] = filepath
+    return files
+
+
 class PreviewLightField(bpy.types.Operator):
     bl_idname = "view3d.lightfield_preview"
     bl_label = "interface for preview light field"
 
+    mode: bpy.props.EnumProperty(
+        items=[
+            ('AUTO', 'Auto', 'rendered views when a render exists, else the live camera'),
+            ('LIVE', 'Live', 'move the camera through the grid'),
+            ('IMAGE', 'Image', 'show the rendered views')],
+        default='AUTO')
+    cache_size: bpy.props.IntProperty(
+        default=16, min=1,
+        description='number of decoded views kept in memory')
+
     camera = None
     poses = None
     current_pos = [0, 0]
@@ -28,16 +87,69 @@ class PreviewLightField(bpy.types.Operator):
     def update_view(self, s, t):
         s, t = self.poses.bound(s, t)
         self.current_pos = s, t
-        self.camera.location = self.poses[s, t]
+        if self.cache is None:
+            self.camera.location = self.poses[s, t]
+            return
+        # swap the image and decode the neighbours while the user looks
+        self.cache.get((s, t))
+        self.area.tag_redraw()
+        self.queue = [
+            self.poses.bound(s+ds, t+dt)
+            for ds, dt in [(0, 1), (0, -1), (1, 0), (-1, 0)]]
+        if not bpy.app.timers.is_registered(self.prefetcher):
+            bpy.app.timers.register(self.prefetcher, first_interval=0.05)
+
+    def prefetch(self):
+        if self.cache is None:
+            return None
+        while self.queue:
+            pos = self.queue.pop(0)
+            if pos not in self.cache:
+                self.cache.get(pos)
+                # keep the current view the most recently used one
+                self.cache.get(tuple(self.current_pos))
+                return 0.01
+        return None
+
+    def draw(self):
+        from gpu_extras.presets import draw_texture_2d
+        # the handler runs for every 3d view, only draw into this one
+        if bpy.context.area != self.area:
+            return
+        texture = self.cache.get(tuple(self.current_pos))
+        if texture is None:
+            return
+        region = next(r for r in self.area.regions if r.type == 'WINDOW')
+        scale = min(region.width / texture.width, region.height / texture.height)
+        w, h = texture.width * scale, texture.height * scale
+        draw_texture_2d(
+            texture, ((region.width - w) / 2, (region.height - h) / 2), w, h)
 
     def init(self, context):
         self.camera = context.object
+        self.area = context.area
+        self.cache = None
+        self.queue = []
+        self.handler = None
+        self.prefetcher = self.prefetch # timers are looked up by identity
         space = context.area.spaces.active
         self.setup['perspective'] = space.region_3d.view_perspective
         bpy.ops.view3d.object_as_camera()
+        if self.mode != 'LIVE':
+            files = rendered_views(
+                context.scene, self.camera, CamPoses(self.camera))
+            if files:
+                self.cache = ViewCache(files, self.cache_size)
+                self.handler = bpy.types.SpaceView3D.draw_handler_add(
+                    self.draw, (), 'WINDOW', 'POST_PIXEL')
         self.reset(context)
 
     def clear(self, context):
+        if self.cache is not None:
+            bpy.types.SpaceView3D.draw_handler_remove(self.handler, 'WINDOW')
+            self.cache.clear()
+            self.cache = None
+            self.area.tag_redraw()
         self.camera.location = self.poses.pos
         space = context.area.spaces.active
         space.region_3d.view_perspective = self.setup['perspective']
@@ -46,7 +158,7 @@ class PreviewLightField(bpy.types.Operator):
 
     def reset(self, context):
         # shift camera back to the center
-        if self.poses:
+        if self.poses and self.cache is None:
             shift = self.camera.location - self.poses[self.current_pos]
             self.camera.location = self.poses.pos + shift
 
@@ -79,6 +191,11 @@ class PreviewLightField(bpy.types.Operator):
         cam = context.object
         if cam.type != 'CAMERA' or not cam.lightfield.enabled:
             return {'FINISHED'}
+        if self.mode == 'IMAGE' and not rendered_views(
+                context.scene, cam, CamPoses(cam)):
+            self.report({'ERROR'}, 'no rendered views of this camera in the '
+                        'output directory')
+            return {'CANCELLED'}
         self.init(context)
         context.window_manager.modal_handler_add(self)
         # bpy.ops.view3d.camera_to_view()
@@ -0,0 +1,55 @@
+"""Bounded pool of threads encoding and writing images in the background.
+
+submit blocks once max_pending images are queued or being written, which
+caps the memory held by finished renders waiting for their turn.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import image
+
+
+class WriterPool(object):
+    def __init__(self, workers=2, max_pending=4):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='lightfield-writer')
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.futures = []
+        self.errors = []
+
+    def write(self, filepath, data, callback, **kwargs):
+        # the callback gets the seconds spent encoding and writing
+        try:
+            start = time.perf_counter()
+            image.write(filepath, data, **kwargs)
+            if callback is not None:
+                with self.lock: # callbacks append to shared files
+                    callback(time.perf_counter() - start)
+        except Exception as e:
+            self.errors.append((filepath, e))
+            raise
+        finally:
+            self.slots.release()
+
+    def submit(self, filepath, data, callback=None, **kwargs):
+        self.slots.acquire()
+        self.futures = [f for f in self.futures if not f.done()]
+        self.futures.append(self.executor.submit(
+            self.write, filepath, data, callback, **kwargs))
+
+    def flush(self):
+        # wait for every pending write, the first error is raised again
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.exception()
+        if self.errors:
+            filepath, error = self.errors[0]
+            raise RuntimeError(f'writing {filepath} failed') from error
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.executor.shutdown()